@@ -0,0 +1,186 @@
+import asyncio
+import importlib
+import json
+import os
+import tempfile
+import click
+
+SCENARIOS = ("webhook", "builds", "upload")
+UPLOAD_VARIANTS = ("tar.zst", "tar.gz", "7z", "cas")
+WEBHOOK_SECRET = "benchmark-secret"
+
+def configure_environment(workdir, s3_url, database_url, telegram_url, build_concurrency, embedded_runner):
+    os.environ.update({
+        "DATABASE_URL": database_url,
+        "S3_ENDPOINT_URL": s3_url,
+        "S3_ACCESS_KEY": "benchmark",
+        "S3_SECRET_KEY": "benchmark",
+        "S3_DEFAULT_REGION": "us-east-1",
+        "TELEGRAM_BOT_TOKEN": "123456:benchmark",
+        "TELEGRAM_API_URL": telegram_url,
+        "WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "EMBEDDED_RUNNER": str(embedded_runner).lower(),
+        "MAX_CONCURRENT_BUILDS": str(build_concurrency),
+        "BUILD_POLL_INTERVAL": "0.5",
+        "NOTIFY_BATCH_WINDOW": "0.5",
+        "REPO_CACHE_DIR": os.path.join(workdir, "repos"),
+        "ARTIFACT_INDEX_PATH": os.path.join(workdir, "blob-index"),
+        "CACHE_STATE_DIR": os.path.join(workdir, "build-caches"),
+        "CONTAINER_POOL_DIR": os.path.join(workdir, "pool"),
+        "WORKSPACE_BASE_DIR": os.path.join(workdir, "workspace-bases")
+    })
+
+def docker_available():
+    try:
+        import docker
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    click.echo(f"{'metric':<44} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if reference is None or not reference["value"]:
+            click.echo(f"{name:<44} {'-':>12} {current['value']:>12g} {'':>8}")
+            continue
+
+        change = (current["value"] - reference["value"]) / reference["value"]
+        worse = change > tolerance if current["better"] == "lower" else change < -tolerance
+        if worse:
+            regressions.append(name)
+        flag = "  REGRESSION" if worse else ""
+        click.echo(f"{name:<44} {reference['value']:>12g} {current['value']:>12g} {change:>+8.1%}{flag}")
+    return regressions
+
+async def run_scenarios(selected, workdir, telegram, options):
+    from benchmarks import scenarios
+    from benchmarks.standins import LocalGitRepo, free_port
+    main = importlib.import_module("swompi.main")
+    from swompi.functions import create_repo, get_repo_by_name, add_user, get_user_by_chat, subscribe
+    from swompi.storage import FileStorageRepository
+    from aiohttp import web
+
+    main.initialize_database()
+    git_repo = LocalGitRepo(os.path.join(workdir, "git"), options["image"], options["log_kb"], options["artifact_kb"])
+    with main.db_session_factory() as db_session:
+        create_repo(db_session, git_repo.url, "benchmark")
+        repository_id = get_repo_by_name(db_session, "benchmark").id
+        add_user(db_session, "benchmark", "1000")
+        subscribe(db_session, get_user_by_chat(db_session, "1000").id, repository_id, None, False)
+
+    runner = web.AppRunner(main.create_app(with_bot=False), access_log=None)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    webhook_url = f"http://127.0.0.1:{port}/webhook"
+
+    results = {}
+    try:
+        if "webhook" in selected:
+            head_sha = git_repo.work.head.commit.hexsha
+            untracked = [git_repo.payload("main", head_sha, url="file:///untracked.git") for _ in range(options["requests"])]
+            results |= await scenarios.webhook_latency("untracked", webhook_url, untracked, options["concurrency"], WEBHOOK_SECRET, 403)
+            pushes = [git_repo.payload("bench-webhook", head_sha) for _ in range(options["requests"])]
+            results |= await scenarios.webhook_latency("push", webhook_url, pushes, options["concurrency"], WEBHOOK_SECRET, 202)
+            await asyncio.to_thread(scenarios.cancel_pending_builds, main.db_session_factory)
+
+        if "builds" in selected:
+            if main.executor is None:
+                click.echo("Docker is not available, skipping the builds scenario")
+            else:
+                main.executor.workspaces.start()
+                main.executor.container_pool.start()
+                main.executor.notifications.start()
+                main.dispatcher.start()
+                payloads = [git_repo.push(f"bench-build-{n}") for n in range(options["builds"])]
+                results |= await scenarios.build_throughput(
+                    webhook_url, payloads, options["builds"], WEBHOOK_SECRET, main.db_session_factory, telegram, options["build_timeout"]
+                )
+
+        if "upload" in selected:
+            for variant in UPLOAD_VARIANTS:
+                config = main.config.model_copy(update={
+                    "ARCHIVE_FORMAT": "tar.zst" if variant == "cas" else variant,
+                    "ARTIFACT_DEDUP": variant == "cas",
+                    "ARTIFACT_INDEX_PATH": os.path.join(workdir, f"blob-index-{variant}")
+                })
+                file_storage = FileStorageRepository(config)
+                results |= await asyncio.to_thread(
+                    scenarios.upload_results, variant, file_storage, workdir, options["log_kb"], options["artifact_kb"], options["upload_repeat"]
+                )
+    finally:
+        await runner.cleanup()
+    return results
+
+@click.command()
+@click.option("--scenario", "selected", multiple=True, type=click.Choice(SCENARIOS), help="Scenario to run (repeatable), all by default")
+@click.option("--database", type=click.Choice(["sqlite", "postgres"]), default="sqlite", help="Run against SQLite or a PostgreSQL container")
+@click.option("--requests", type=int, default=2000, help="Webhook deliveries per webhook scenario")
+@click.option("--concurrency", type=int, default=50, help="Webhook deliveries in flight")
+@click.option("--builds", type=int, default=8, help="Concurrent pushes in the builds scenario")
+@click.option("--build-concurrency", type=int, default=4, help="MAX_CONCURRENT_BUILDS of the embedded runner")
+@click.option("--build-timeout", type=int, default=600, help="Seconds to wait for the builds scenario")
+@click.option("--image", default="alpine:3.20", help="Image of the benchmark pipeline")
+@click.option("--log-kb", type=int, default=512, help="Size of the build log written by each build")
+@click.option("--artifact-kb", type=int, default=4096, help="Size of the artifact written by each build")
+@click.option("--upload-repeat", type=int, default=3, help="Uploads per archive variant")
+@click.option("--baseline", default=os.path.join(os.path.dirname(__file__), "baseline.json"), help="Baseline file to compare with")
+@click.option("--tolerance", type=float, default=0.15, help="Relative change reported as a regression")
+@click.option("--save-baseline", is_flag=True, help="Store the results as the new baseline")
+@click.option("--output", default=None, help="Also write the results to this JSON file")
+def benchmark(selected, database, baseline, tolerance, save_baseline, output, **options):
+    from benchmarks.standins import S3Server, PostgresContainer, TelegramStub
+    selected = selected or SCENARIOS
+    workdir = tempfile.mkdtemp(prefix="swompi_bench_")
+
+    s3 = S3Server()
+    s3.start()
+    postgres = None
+    if database == "postgres":
+        postgres = PostgresContainer()
+        postgres.start()
+    database_url = postgres.url if postgres else f"sqlite:///{os.path.join(workdir, 'swompi.db')}"
+
+    async def run():
+        telegram = TelegramStub()
+        await telegram.start()
+        try:
+            configure_environment(workdir, s3.url, database_url, telegram.url, options["build_concurrency"], docker_available())
+            return await run_scenarios(selected, workdir, telegram, options)
+        finally:
+            await telegram.stop()
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        s3.stop()
+        if postgres:
+            postgres.stop()
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if save_baseline:
+        with open(baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        click.echo(f"Baseline saved to {baseline}")
+        return
+
+    stored = {}
+    if os.path.exists(baseline):
+        with open(baseline) as f:
+            stored = json.load(f)
+    else:
+        click.echo(f"No baseline at {baseline}, run with --save-baseline to create one")
+
+    regressions = compare(results, stored, tolerance)
+    if regressions:
+        click.echo(f"{len(regressions)} metric(s) regressed by more than {tolerance:.0%}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    benchmark()
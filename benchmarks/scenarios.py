@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import statistics
+import tempfile
+import time
+from aiohttp import ClientSession
+from sqlalchemy import select, update
+from swompi.models import Build, BuildStatus
+
+FINISHED_STATUSES = (BuildStatus.success, BuildStatus.failed, BuildStatus.cancelled)
+
+def metric(value, unit, better):
+    return {"value": round(value, 3), "unit": unit, "better": better}
+
+def percentiles(values):
+    if len(values) < 2:
+        value = values[0] if values else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+def sign(body, secret):
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+async def post_webhooks(url, payloads, concurrency, secret):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = {}
+
+    async def post(session, payload):
+        body = json.dumps(payload).encode()
+        headers = {"Content-Type": "application/json", "X-GitHub-Event": "push", "X-Hub-Signature-256": sign(body, secret)}
+        async with semaphore:
+            started = time.perf_counter()
+            async with session.post(url, data=body, headers=headers) as response:
+                await response.read()
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    started = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(post(session, payload) for payload in payloads))
+    return latencies, statuses, time.perf_counter() - started
+
+async def webhook_latency(name, url, payloads, concurrency, secret, expected_status):
+    latencies, statuses, elapsed = await post_webhooks(url, payloads, concurrency, secret)
+    unexpected = sum(count for status, count in statuses.items() if status != expected_status)
+    if unexpected:
+        print(f"WARNING: {unexpected} of {len(payloads)} {name} deliveries were not answered with {expected_status}: {statuses}")
+
+    p50, p95, p99 = percentiles(latencies)
+    return {
+        f"webhook.{name}.p50_ms": metric(p50 * 1000, "ms", "lower"),
+        f"webhook.{name}.p95_ms": metric(p95 * 1000, "ms", "lower"),
+        f"webhook.{name}.p99_ms": metric(p99 * 1000, "ms", "lower"),
+        f"webhook.{name}.requests_per_second": metric(len(payloads) / elapsed, "req/s", "higher")
+    }
+
+def cancel_pending_builds(db_session_factory):
+    with db_session_factory() as db_session:
+        db_session.execute(update(Build).where(Build.status == BuildStatus.pending).values(status=BuildStatus.cancelled))
+        db_session.commit()
+
+def load_builds(db_session_factory, commit_shas):
+    with db_session_factory() as db_session:
+        return list(db_session.execute(select(Build).where(Build.commit_sha.in_(commit_shas))).scalars().all())
+
+async def build_throughput(url, payloads, concurrency, secret, db_session_factory, telegram, timeout):
+    commit_shas = [payload["after"] for payload in payloads]
+    messages_before = len(telegram.messages)
+    started = time.perf_counter()
+    await post_webhooks(url, payloads, concurrency, secret)
+
+    deadline = time.monotonic() + timeout
+    while True:
+        builds = await asyncio.to_thread(load_builds, db_session_factory, commit_shas)
+        if len(builds) == len(payloads) and all(build.status in FINISHED_STATUSES for build in builds):
+            break
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Builds did not finish in {timeout}s")
+        await asyncio.sleep(0.5)
+    elapsed = time.perf_counter() - started
+
+    notify_deadline = time.monotonic() + 30
+    while len(telegram.messages) == messages_before and time.monotonic() < notify_deadline:
+        await asyncio.sleep(0.5)
+
+    failed = [build.id for build in builds if build.status != BuildStatus.success]
+    if failed:
+        print(f"WARNING: build(s) {', '.join(map(str, failed))} did not succeed")
+    p50, p95, _ = percentiles([(build.finished_at - build.created_at).total_seconds() for build in builds])
+    return {
+        "builds.per_minute": metric(len(builds) / elapsed * 60, "builds/min", "higher"),
+        "builds.duration_p50_s": metric(p50, "s", "lower"),
+        "builds.duration_p95_s": metric(p95, "s", "lower"),
+        "builds.failed": metric(len(failed), "builds", "lower"),
+        "builds.notifications": metric(len(telegram.messages) - messages_before, "messages", "higher")
+    }
+
+def make_workspace(root, log_kb, artifact_kb):
+    workspace_path = tempfile.mkdtemp(dir=root)
+    with open(os.path.join(workspace_path, "build.log"), "w") as f:
+        for line in range(log_kb * 1024 // 64):
+            f.write(f"[{line:08d}] step finished, collecting output of the build job\n")
+    os.makedirs(os.path.join(workspace_path, "out"))
+    with open(os.path.join(workspace_path, "out", "blob.bin"), "wb") as f:
+        f.write(os.urandom(artifact_kb * 1024))
+    return workspace_path
+
+def bucket_size(file_storage):
+    total = 0
+    paginator = file_storage.s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=file_storage.BUCKET):
+        total += sum(item["Size"] for item in page.get("Contents", []))
+    return total
+
+def upload_results(name, file_storage, root, log_kb, artifact_kb, repeat):
+    seconds = []
+    uploaded = []
+    input_bytes = 0
+    for attempt in range(repeat):
+        workspace_path = make_workspace(root, log_kb, artifact_kb)
+        input_bytes = sum(os.path.getsize(os.path.join(dirpath, filename)) for dirpath, _, filenames in os.walk(workspace_path) for filename in filenames)
+        size_before = bucket_size(file_storage)
+        started = time.perf_counter()
+        file_storage.upload_logs_and_artifacts(900000 + attempt, [("", workspace_path, ["out/"])])
+        seconds.append(time.perf_counter() - started)
+        uploaded.append(bucket_size(file_storage) - size_before)
+
+    median = statistics.median(seconds)
+    return {
+        f"upload.{name}.seconds": metric(median, "s", "lower"),
+        f"upload.{name}.bytes": metric(statistics.median(uploaded), "bytes", "lower"),
+        f"upload.{name}.input_mb_per_second": metric(input_bytes / median / (1024 * 1024), "MB/s", "higher")
+    }
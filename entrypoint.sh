@@ -23,4 +23,7 @@ set -a
 set +a
 echo "Variables loaded."
 
+if [ "$#" -gt 0 ]; then
+  exec "$@"
+fi
 exec python /app/swompi/main.py
\ No newline at end of file
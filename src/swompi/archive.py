@@ -0,0 +1,123 @@
+import io
+import gzip
+import os
+import tarfile
+import threading
+from contextlib import contextmanager
+import py7zr
+from concurrent.futures import ThreadPoolExecutor
+
+ARCHIVE_FORMATS = ("tar.zst", "tar.gz", "7z")
+
+class S3MultipartWriter(io.RawIOBase):
+    def __init__(self, s3_client, bucket, object_key, part_size, concurrency):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.object_key = object_key
+        self.part_size = part_size
+
+        self._buffer = bytearray()
+        self._parts = []
+        self._futures = []
+        self._part_number = 0
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="swompi-upload")
+        self._upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=object_key)["UploadId"]
+        self.bytes_written = 0
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._submit_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._futures:
+                self._submit_part(bytes(self._buffer))
+                self._buffer.clear()
+            for future in self._futures:
+                future.result()
+
+            parts = sorted(self._parts, key=lambda part: part["PartNumber"])
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.object_key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._pool.shutdown(wait=True)
+            super().close()
+
+    def abort(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.object_key, UploadId=self._upload_id)
+        print(f"Multipart upload of {self.object_key} aborted")
+        super().close()
+
+    def _submit_part(self, data):
+        self._part_number += 1
+        self._slots.acquire()
+        self._futures.append(self._pool.submit(self._upload_part, self._part_number, data))
+
+    def _upload_part(self, part_number, data):
+        try:
+            response = self.s3_client.upload_part(
+                Bucket=self.bucket,
+                Key=self.object_key,
+                UploadId=self._upload_id,
+                PartNumber=part_number,
+                Body=data
+            )
+            self._parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+        finally:
+            self._slots.release()
+
+def write_tar_archive(fileobj, members, archive_format, level=None):
+    with open_tar_stream(fileobj, archive_format, level) as archive:
+        for path, arcname in members:
+            archive.add(path, arcname=arcname, recursive=True)
+
+@contextmanager
+def open_tar_stream(fileobj, archive_format, level=None):
+    if archive_format == "tar.zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("The tar.zst archive format requires the 'zstandard' package")
+
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level, threads=-1)
+        with compressor.stream_writer(fileobj, closefd=False) as compressed:
+            with tarfile.open(fileobj=compressed, mode="w|") as archive:
+                yield archive
+    elif archive_format == "tar.gz":
+        with gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=6 if level is None else level) as compressed:
+            with tarfile.open(fileobj=compressed, mode="w|") as archive:
+                yield archive
+    else:
+        raise ValueError(f"Unsupported streaming archive format: {archive_format}")
+
+def write_7z_archive(archive_path, members):
+    with py7zr.SevenZipFile(archive_path, 'w') as archive:
+        for path, arcname in members:
+            if os.path.isdir(path):
+                archive.writeall(path, arcname)
+            else:
+                archive.write(path, arcname)
@@ -0,0 +1,155 @@
+import os
+import json
+import stat
+import hashlib
+import tarfile
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from swompi.archive import open_tar_stream
+
+HASH_CHUNK_SIZE = 1024 * 1024
+GENERATION_KEY = "meta/blob-generation"
+
+class ContentAddressedStore:
+    def __init__(self, s3_client, bucket, config):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.index_path = config.ARTIFACT_INDEX_PATH
+        self.upload_concurrency = config.UPLOAD_CONCURRENCY
+
+        self._lock = threading.Lock()
+        self._generation = self._load_generation()
+        self._known_hashes = self._load_index()
+
+    def blob_key(self, digest: str) -> str:
+        return f"blobs/{digest[:2]}/{digest}"
+
+    def manifest_key(self, build_id: int) -> str:
+        return f"manifests/{build_id}.json"
+
+    def upload_tree(self, build_id: int, members: list[tuple[str, str]]) -> tuple[str, dict]:
+        self._check_generation()
+        files = list(self._walk_members(members))
+        with ThreadPoolExecutor(max_workers=self.upload_concurrency, thread_name_prefix="swompi-blob") as pool:
+            entries = list(pool.map(lambda item: self._store_file(*item), files))
+
+        uploaded = sum(1 for entry in entries if entry.pop("uploaded"))
+        manifest = {"build_id": build_id, "files": entries}
+        manifest_key = self.manifest_key(build_id)
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=manifest_key,
+            Body=json.dumps(manifest).encode("utf-8"),
+            ContentType="application/json"
+        )
+        print(f"Stored {len(entries)} file(s) for build {build_id}, {uploaded} new blob(s) uploaded")
+        return manifest_key, manifest
+
+    def bump_generation(self) -> None:
+        self.s3_client.put_object(Bucket=self.bucket, Key=GENERATION_KEY, Body=uuid.uuid4().hex.encode("utf-8"))
+
+    def load_manifest(self, manifest_key: str) -> dict:
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=manifest_key)
+        return json.loads(response["Body"].read())
+
+    def write_archive(self, manifest: dict, fileobj, archive_format: str, level=None) -> None:
+        with open_tar_stream(fileobj, archive_format, level) as archive:
+            for entry in manifest["files"]:
+                info = tarfile.TarInfo(entry["path"])
+                info.size = entry["size"]
+                info.mode = entry["mode"]
+                body = self.s3_client.get_object(Bucket=self.bucket, Key=self.blob_key(entry["sha256"]))["Body"]
+                archive.addfile(info, body)
+
+    def _walk_members(self, members):
+        for path, arcname in members:
+            if os.path.isdir(path):
+                for root, dirs, files in os.walk(path):
+                    dirs.sort()
+                    for name in sorted(files):
+                        file_path = os.path.join(root, name)
+                        relative = os.path.relpath(file_path, path)
+                        yield file_path, f"{arcname}/{relative}"
+            elif os.path.isfile(path):
+                yield path, arcname
+
+    def _store_file(self, file_path, arcname):
+        digest = self._hash_file(file_path)
+        file_stat = os.stat(file_path)
+        uploaded = False
+
+        if not self._is_known(digest):
+            if not self._blob_exists(digest):
+                self.s3_client.upload_file(file_path, self.bucket, self.blob_key(digest))
+                uploaded = True
+            self._remember(digest)
+
+        return {
+            "path": arcname,
+            "sha256": digest,
+            "size": file_stat.st_size,
+            "mode": stat.S_IMODE(file_stat.st_mode),
+            "uploaded": uploaded
+        }
+
+    def _hash_file(self, file_path):
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _blob_exists(self, digest):
+        try:
+            self.s3_client.head_object(Bucket=self.bucket, Key=self.blob_key(digest))
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ['404', 'NoSuchKey', 'NotFound']:
+                return False
+            raise
+
+    def _is_known(self, digest):
+        with self._lock:
+            return digest in self._known_hashes
+
+    def _remember(self, digest):
+        with self._lock:
+            if digest in self._known_hashes:
+                return
+            self._known_hashes.add(digest)
+            with open(self.index_path, "a") as index_file:
+                index_file.write(f"{digest}\n")
+
+    def _check_generation(self):
+        try:
+            generation = self.s3_client.get_object(Bucket=self.bucket, Key=GENERATION_KEY)["Body"].read().decode("utf-8")
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ['404', 'NoSuchKey', 'NotFound']:
+                raise
+            generation = ""
+
+        with self._lock:
+            if generation == self._generation:
+                return
+            print(f"Blobs were garbage collected, resetting the local index at {self.index_path}")
+            self._known_hashes = set()
+            open(self.index_path, "w").close()
+            with open(f"{self.index_path}.generation", "w") as generation_file:
+                generation_file.write(generation)
+            self._generation = generation
+
+    def _load_generation(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        if not os.path.exists(f"{self.index_path}.generation"):
+            return ""
+        with open(f"{self.index_path}.generation") as generation_file:
+            return generation_file.read().strip()
+
+    def _load_index(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        if not os.path.exists(self.index_path):
+            return set()
+        with open(self.index_path) as index_file:
+            return {line.strip() for line in index_file if line.strip()}
@@ -1,75 +1,245 @@
 import asyncio
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command, CommandObject
-from aiogram.types import FSInputFile
+from aiogram.types import FSInputFile, BufferedInputFile
 from swompi.config import AppConfig
 from swompi.session import engine, SessionLocal as db_session_factory
 import os
-from functions import * 
+from swompi.functions import (
+    add_user, get_build, get_latest_builds_by_repo, get_repo_by_name, get_user_by_chat,
+    get_user_subscriptions, subscribe, unsubscribe
+)
 import tempfile
-from storage import FileStorageRepository
+from swompi.storage import FileStorageRepository
+from swompi.notifications import telegram_session
 
 config = AppConfig()
 storage = FileStorageRepository(config)
 API_TOKEN = config.TELEGRAM_BOT_TOKEN
+TAIL_SIZE = 3500
+HISTORY_PAGE_SIZE = 10
+FILES_PAGE_SIZE = 50
+FILE_LIMIT = config.TELEGRAM_FILE_LIMIT_MB * 1024 * 1024
 
-bot = Bot(token=API_TOKEN)
+bot = Bot(token=API_TOKEN, session=telegram_session(config.TELEGRAM_API_URL))
 dp = Dispatcher()
 
 @dp.message(Command("start"))
 async def cmd_start(message: types.Message):
-    with db_session_factory() as db_session:
-        add_user(db_session, message.from_user.username or str(message.from_user.id), str(message.chat.id))
-        await message.answer("You are registered in the Swompi system")
+    await asyncio.to_thread(register_chat, message.from_user.username or str(message.from_user.id), str(message.chat.id))
+    await message.answer("You are registered in the Swompi system")
+
+@dp.message(Command("subscribe"))
+async def cmd_subscribe(message: types.Message, command: CommandObject):
+    args = (command.args or "").split()
+    if not args:
+        return await message.answer("Usage: /subscribe <repository> [ref] [failures]")
+    failures_only = args[-1] == "failures"
+    if failures_only:
+        args = args[:-1]
+    repo_name = args[0] if args else None
+    ref_name = args[1] if len(args) > 1 else None
+
+    error = await asyncio.to_thread(subscribe_chat, str(message.chat.id), repo_name, ref_name, failures_only)
+    if error:
+        return await message.answer(error)
+
+    scope = f"{repo_name} ({ref_name})" if ref_name else f"{repo_name} (all refs)"
+    kind = "failed builds" if failures_only else "all builds"
+    await message.answer(f"Subscribed to {kind} of {scope}")
+
+@dp.message(Command("unsubscribe"))
+async def cmd_unsubscribe(message: types.Message, command: CommandObject):
+    args = (command.args or "").split()
+    if not args:
+        return await message.answer("Usage: /unsubscribe <repository> [ref]")
+    repo_name = args[0]
+    ref_name = args[1] if len(args) > 1 else None
+
+    removed = await asyncio.to_thread(unsubscribe_chat, str(message.chat.id), repo_name, ref_name)
+
+    if not removed:
+        return await message.answer(f"You are not subscribed to '{' '.join(args)}'")
+    await message.answer(f"Unsubscribed from {' '.join(args)}")
+
+@dp.message(Command("subscriptions"))
+async def cmd_subscriptions(message: types.Message):
+    lines = await asyncio.to_thread(list_chat_subscriptions, str(message.chat.id))
+    if not lines:
+        return await message.answer("You have no subscriptions. Use /subscribe <repository> [ref] [failures]")
+    await message.answer("\n".join(lines))
 
 @dp.message(Command("history"))
 async def cmd_history(message: types.Message, command: CommandObject):
-    repo_name = command.args
-    if not repo_name:
+    args = (command.args or "").split()
+    if not args:
         return await message.answer("Please enter the repository name")
-    with db_session_factory() as db_session:    
-        result = get_latest_builds_by_repo(db_session, repo_name)
-        if not result:
-            await message.answer(f"There is no such repository as '{repo_name}'")
-        else:
-            answer = ""
-            for build in result:
-                answer += f"Build: {build.id}, status: {build.status}, finished at {build.finished_at}, author: {build.commit_author}\n"
-            await message.answer(answer)
+    repo_name = args[0]
+    before_build_id = int(args[1]) if len(args) > 1 and args[1].isdigit() else None
+    result = await asyncio.to_thread(list_history, repo_name, before_build_id)
+    if not result:
+        await message.answer(f"There is no such repository as '{repo_name}'" if before_build_id is None else "No older builds")
+    else:
+        answer = "".join(line for _, line in result)
+        if len(result) == HISTORY_PAGE_SIZE:
+            answer += f"\nOlder: /history {repo_name} {result[-1][0]}"
+        await message.answer(answer)
 
 @dp.message(Command("status"))
 async def cmd_status(message: types.Message, command: CommandObject):
     build_id = command.args
-    if not build_id:
+    if not build_id or not build_id.isdigit():
         return await message.answer("Please enter the bild_id")
 
+    log_key, artifacts_key = await asyncio.to_thread(get_build_keys, int(build_id))
+    if not artifacts_key and (not log_key or log_key == "None"):
+        return await message.answer(f"There is no archive for build {build_id}")
+    extension = storage.build_archive_extension(log_key, artifacts_key)
+
+    size = await asyncio.to_thread(storage.build_archive_size, log_key, artifacts_key)
+    if size is not None and size > FILE_LIMIT:
+        await message.answer(f"In progress...")
+        url = await asyncio.to_thread(storage.build_archive_url, int(build_id), log_key, artifacts_key)
+        return await message.answer(f"Build {build_id} is too large for Telegram, download it within {storage.presigned_url_ttl // 60} min:\n{url}")
+
     with tempfile.NamedTemporaryFile(
         mode='wb',  
         prefix=f"build_{build_id}_",
-        suffix='.7z',
+        suffix=f".{extension}",
         dir="/tmp",  
         delete=False
     ) as temp_file:
         file_path = temp_file.name
         await message.answer(f"In progress...")
-        success=storage.download_file_to_path(f"{build_id}.7z", file_path)
+        success=await asyncio.to_thread(storage.download_build_archive, log_key, artifacts_key, file_path)
         if not success:
             return await message.answer(f"Failed to upload build {build_id}")
         temp_file.close()
-        input_file = FSInputFile(file_path, filename=f"build_{build_id}.7z")
+        input_file = FSInputFile(file_path, filename=f"build_{build_id}.{extension}")
         await message.answer_document(input_file)
     
     os.unlink(file_path)
 
-async def send_build_notification(build_id: int):
-    with db_session_factory() as db_session:    
-        result = get_build_status(db_session, build_id)
-        text = f"Build {build_id} finished with status:{result}"
-        users = db_session.execute(
-                select(User).where(User.chat_id.is_not(None))
-            ).scalars().all()
-    for user in users:
-        await bot.send_message(str(user.chat_id), text, parse_mode="Markdown")
+@dp.message(Command("tail"))
+async def cmd_tail(message: types.Message, command: CommandObject):
+    args = (command.args or "").split()
+    if not args or not args[0].isdigit():
+        return await message.answer("Please enter the build_id and optionally the job name and offset")
+    build_id = int(args[0])
+    job_name = next((arg for arg in args[1:] if not arg.lstrip("-").isdigit()), None)
+    offset = next((int(arg) for arg in args[1:] if arg.lstrip("-").isdigit()), -TAIL_SIZE)
+
+    jobs = await asyncio.to_thread(storage.list_log_jobs, build_id)
+    if not jobs:
+        return await tail_archived_log(message, build_id, job_name, offset)
+    if job_name is None:
+        job_name = jobs[0]
+    elif job_name not in jobs:
+        return await message.answer(f"Build {build_id} has no job '{job_name}'. Jobs: {', '.join(jobs)}")
+
+    data, next_offset = await asyncio.to_thread(storage.read_log, build_id, job_name, offset, TAIL_SIZE)
+    text = data.decode("utf-8", errors="replace") if data else "No new log output"
+    await message.answer(f"{text}\n\nNext: /tail {build_id} {job_name} {next_offset}")
+
+async def tail_archived_log(message, build_id, job_name, offset):
+    _, artifacts_key = await asyncio.to_thread(get_build_keys, build_id)
+    log_name = f"{job_name}/build.log" if job_name else "build.log"
+    entry = await asyncio.to_thread(storage.find_build_file, artifacts_key, log_name)
+    if entry is None:
+        return await message.answer(f"There is no log for build {build_id} yet")
+
+    data, next_offset = await asyncio.to_thread(storage.read_build_file, entry, offset, TAIL_SIZE)
+    text = data.decode("utf-8", errors="replace") if data else "No new log output"
+    next_command = " ".join(str(part) for part in (build_id, job_name, next_offset) if part is not None)
+    await message.answer(f"{text}\n\nNext: /tail {next_command}")
+
+@dp.message(Command("files"))
+async def cmd_files(message: types.Message, command: CommandObject):
+    build_id = command.args
+    if not build_id or not build_id.strip().isdigit():
+        return await message.answer("Please enter the build_id")
+
+    _, artifacts_key = await asyncio.to_thread(get_build_keys, int(build_id))
+    files = await asyncio.to_thread(storage.list_build_files, artifacts_key)
+    if not files:
+        return await message.answer(f"There is no file list for build {build_id}, use /status {build_id} to get the whole archive")
+
+    lines = [f"{entry['name']} ({format_size(entry['size'])})" for entry in files[:FILES_PAGE_SIZE]]
+    if len(files) > FILES_PAGE_SIZE:
+        lines.append(f"... and {len(files) - FILES_PAGE_SIZE} more")
+    await message.answer("\n".join(lines) + f"\n\nGet one with /artifact {build_id.strip()} <path>")
+
+@dp.message(Command("artifact"))
+async def cmd_artifact(message: types.Message, command: CommandObject):
+    args = (command.args or "").split(maxsplit=1)
+    if len(args) < 2 or not args[0].isdigit():
+        return await message.answer("Usage: /artifact <build_id> <path>")
+    build_id, name = int(args[0]), args[1]
+
+    _, artifacts_key = await asyncio.to_thread(get_build_keys, build_id)
+    entry = await asyncio.to_thread(storage.find_build_file, artifacts_key, name)
+    if entry is None:
+        return await message.answer(f"Build {build_id} has no file '{name}'. See /files {build_id}")
+
+    filename = os.path.basename(entry["name"])
+    if entry["size"] > FILE_LIMIT:
+        url = await asyncio.to_thread(storage.build_file_url, entry)
+        return await message.answer(f"{filename} is too large for Telegram, download it within {storage.presigned_url_ttl // 60} min:\n{url}")
+
+    data, _ = await asyncio.to_thread(storage.read_build_file, entry)
+    await message.answer_document(BufferedInputFile(data, filename=filename))
+
+def register_chat(username, chat_id):
+    with db_session_factory() as db_session:
+        add_user(db_session, username, chat_id)
+
+def subscribe_chat(chat_id, repo_name, ref_name, failures_only):
+    with db_session_factory() as db_session:
+        user = get_user_by_chat(db_session, chat_id)
+        if not user:
+            return "Please register with /start first"
+        repository = get_repo_by_name(db_session, repo_name) if repo_name else None
+        if not repository:
+            return f"There is no such repository as '{repo_name}'"
+        subscribe(db_session, user.id, repository.id, ref_name, failures_only)
+    return None
+
+def unsubscribe_chat(chat_id, repo_name, ref_name):
+    with db_session_factory() as db_session:
+        user = get_user_by_chat(db_session, chat_id)
+        repository = get_repo_by_name(db_session, repo_name)
+        return unsubscribe(db_session, user.id, repository.id, ref_name) if user and repository else 0
+
+def list_chat_subscriptions(chat_id):
+    with db_session_factory() as db_session:
+        user = get_user_by_chat(db_session, chat_id)
+        subscriptions = get_user_subscriptions(db_session, user.id) if user else []
+        return [
+            f"{subscription.repository.name} {subscription.ref_name or '(all refs)'}"
+            + (" failures only" if subscription.failures_only else "")
+            for subscription in subscriptions
+        ]
+
+def list_history(repo_name, before_build_id):
+    with db_session_factory() as db_session:
+        result = get_latest_builds_by_repo(db_session, repo_name, HISTORY_PAGE_SIZE, before_build_id)
+        lines = []
+        for build in result or []:
+            cached = f" (cached from {build.cached_from})" if build.cached_from else ""
+            lines.append((build.id, f"Build: {build.id}, status: {build.status}{cached}, finished at {build.finished_at}, author: {build.commit_author}\n"))
+        return lines
+
+def get_build_keys(build_id):
+    with db_session_factory() as db_session:
+        build = get_build(db_session, build_id)
+        return (build.log_key, build.artifacts_key) if build else (None, None)
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
 
 async def main():
     await dp.start_polling(bot)
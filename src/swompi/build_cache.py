@@ -0,0 +1,110 @@
+import os
+import time
+import hashlib
+import threading
+import docker
+
+CACHE_LABEL = "swompi.cache"
+
+class BuildCacheManager:
+    def __init__(self, config):
+        self.client = docker.from_env()
+        self.state_dir = config.CACHE_STATE_DIR
+        self.max_age = config.CACHE_MAX_AGE_DAYS * 24 * 3600
+        self.max_size = config.CACHE_MAX_SIZE_MB * 1024 * 1024
+        self.evict_interval = config.CACHE_EVICT_INTERVAL
+        os.makedirs(self.state_dir, exist_ok=True)
+
+        self._evict_lock = threading.Lock()
+        self._last_evicted = 0
+
+    def volumes_for(self, repository_id, cache_config, workspace_path):
+        if not cache_config:
+            return {}
+
+        key = self._cache_key(cache_config.get("key", "default"), workspace_path)
+        volumes = {}
+        for path in cache_config["paths"]:
+            container_path = path if path.startswith("/") else os.path.normpath(os.path.join("/app", path))
+            digest = hashlib.sha256(f"{repository_id}:{key}:{container_path}".encode()).hexdigest()[:16]
+            volume_name = f"swompi-cache-{repository_id}-{digest}"
+
+            self._ensure_volume(volume_name, repository_id, container_path)
+            os.utime(self._touch(volume_name))
+            volumes[volume_name] = {"bind": container_path, "mode": "rw"}
+            print(f"Cache volume {volume_name} mounted at {container_path}")
+        return volumes
+
+    def evict(self):
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._last_evicted < self.evict_interval:
+                return
+            self._last_evicted = time.monotonic()
+            self._evict()
+        finally:
+            self._evict_lock.release()
+
+    def _cache_key(self, key_config, workspace_path):
+        if isinstance(key_config, str):
+            return key_config
+
+        digest = hashlib.sha256()
+        for file_name in key_config["files"]:
+            digest.update(file_name.encode())
+            file_path = os.path.join(workspace_path, file_name)
+            if os.path.isfile(file_path):
+                with open(file_path, "rb") as f:
+                    digest.update(hashlib.sha256(f.read()).digest())
+        return digest.hexdigest()
+
+    def _ensure_volume(self, volume_name, repository_id, container_path):
+        try:
+            self.client.volumes.get(volume_name)
+        except docker.errors.NotFound:
+            print(f"Creating cache volume {volume_name}")
+            self.client.volumes.create(
+                name=volume_name,
+                labels={CACHE_LABEL: "1", "swompi.repository": str(repository_id), "swompi.path": container_path}
+            )
+
+    def _touch(self, volume_name):
+        marker = os.path.join(self.state_dir, volume_name)
+        if not os.path.exists(marker):
+            open(marker, "a").close()
+        return marker
+
+    def _last_used(self, volume_name):
+        marker = os.path.join(self.state_dir, volume_name)
+        return os.path.getmtime(marker) if os.path.exists(marker) else 0
+
+    def _evict(self):
+        usage = {volume["Name"]: volume for volume in self.client.df().get("Volumes") or []}
+        caches = []
+        for name, volume in usage.items():
+            if (volume.get("Labels") or {}).get(CACHE_LABEL) != "1":
+                continue
+            size = max((volume.get("UsageData") or {}).get("Size", 0), 0)
+            caches.append((self._last_used(name), name, size))
+
+        now = time.time()
+        total = sum(size for _, _, size in caches)
+        for last_used, name, size in sorted(caches):
+            if now - last_used < self.max_age and total <= self.max_size:
+                break
+            if self._remove_volume(name):
+                total -= size
+
+    def _remove_volume(self, volume_name):
+        try:
+            self.client.volumes.get(volume_name).remove()
+        except docker.errors.APIError as e:
+            print(f"Cache volume {volume_name} was not evicted: {e}")
+            return False
+
+        print(f"Evicted cache volume {volume_name}")
+        marker = os.path.join(self.state_dir, volume_name)
+        if os.path.exists(marker):
+            os.unlink(marker)
+        return True
@@ -1,6 +1,13 @@
 import click
-from swompi.functions import create_repo, delete_repo, get_all_repos
-from swompi.session import SessionLocal as db_session_factory
+from datetime import datetime, timedelta
+from swompi.functions import create_repo, delete_repo, get_all_repos, update_repo_clone_mode, update_repo_result_cache, update_repo_workspace_backend, update_repo_retention, purge_build_results, get_phase_percentiles
+from swompi.metrics import PHASES
+from swompi.repo_cache import CLONE_MODES
+from swompi.workspaces import WORKSPACE_BACKENDS
+from swompi.retention import GarbageCollector
+from swompi.storage import FileStorageRepository
+from swompi.config import AppConfig
+from swompi.session import engine, SessionLocal as db_session_factory
 
 @click.group()
 def cli():
@@ -11,20 +18,95 @@ def ls():
     with db_session_factory() as db_session:
         repos = get_all_repos(db_session)
         for n in range(len(repos)):
-            click.echo(f"{n+1}. {repos[n].name} {repos[n].url}. Created at: {repos[n].created_at}")
+            click.echo(f"{n+1}. {repos[n].name} {repos[n].url}. Created at: {repos[n].created_at}. Clone mode: {repos[n].clone_mode}. Result cache: {'on' if repos[n].result_cache else 'off'}. Workspace: {repos[n].workspace_backend or 'default'}. Retention: {format_retention(repos[n])}")
 
 @cli.command()
 @click.argument("url", nargs=1)
 @click.argument("name", nargs=1)
-def create(url, name):
+@click.option("--clone-mode", type=click.Choice(CLONE_MODES), default="full", help="How the repository mirror is fetched")
+@click.option("--depth", type=int, default=None, help="History depth for the shallow clone mode")
+def create(url, name, clone_mode, depth):
     if url.startswith("https://github.com/"):
         with db_session_factory() as db_session:
-            create_repo(db_session, url, name)
+            create_repo(db_session, url, name, clone_mode, depth)
             click.echo("Url succesfully added")
 
     else:
         click.echo("Url must start with \"https://github.com/\"")
 
+@cli.command("clone-mode")
+@click.argument("url")
+@click.argument("mode", type=click.Choice(CLONE_MODES))
+@click.option("--depth", type=int, default=None, help="History depth for the shallow clone mode")
+def clone_mode(url, mode, depth):
+    with db_session_factory() as db_session:
+        if update_repo_clone_mode(db_session, url, mode, depth):
+            click.echo(f"Clone mode set to {mode}")
+        else:
+            click.echo("Url not found")
+
+@cli.command("result-cache")
+@click.argument("url")
+@click.argument("state", type=click.Choice(["on", "off"]))
+def result_cache(url, state):
+    with db_session_factory() as db_session:
+        if update_repo_result_cache(db_session, url, state == "on"):
+            click.echo(f"Result cache turned {state}")
+        else:
+            click.echo("Url not found")
+
+@cli.command("workspace")
+@click.argument("url")
+@click.argument("backend", type=click.Choice(WORKSPACE_BACKENDS + ("default",)))
+def workspace(url, backend):
+    with db_session_factory() as db_session:
+        if update_repo_workspace_backend(db_session, url, None if backend == "default" else backend):
+            click.echo(f"Workspace backend set to {backend}")
+        else:
+            click.echo("Url not found")
+
+@cli.command("retention")
+@click.argument("url")
+@click.option("--keep-builds", type=int, default=None, help="Keep the newest N builds")
+@click.option("--keep-days", type=int, default=None, help="Keep builds younger than this many days")
+@click.option("--keep-latest-success/--no-keep-latest-success", default=None, help="Always keep the latest successful build of every ref")
+def retention(url, keep_builds, keep_days, keep_latest_success):
+    with db_session_factory() as db_session:
+        if update_repo_retention(db_session, url, keep_builds, keep_days, keep_latest_success):
+            click.echo("Retention policy updated, unset options follow the RETENTION_* settings")
+        else:
+            click.echo("Url not found")
+
+@cli.command()
+@click.option("--dry-run", is_flag=True, help="Only count the builds that would be removed")
+def gc(dry_run):
+    config = AppConfig()
+    collector = GarbageCollector(db_session_factory, engine, FileStorageRepository(config), config)
+    stats = collector.run(dry_run)
+    if stats is None:
+        click.echo("Garbage collection is already running")
+    elif dry_run:
+        click.echo(f"{stats['builds']} build(s) would be removed")
+    else:
+        click.echo(f"Removed {stats['builds']} build(s), {stats['objects']} object(s) and {stats['blobs']} blob(s)")
+
+def format_retention(repository):
+    rules = []
+    if repository.keep_builds is not None:
+        rules.append(f"last {repository.keep_builds} builds")
+    if repository.keep_days is not None:
+        rules.append(f"{repository.keep_days} days")
+    if repository.keep_latest_success is not None:
+        rules.append("latest success per ref" if repository.keep_latest_success else "no latest success")
+    return ", ".join(rules) or "default"
+
+@cli.command("purge-results")
+@click.option("--repo", default=None, help="Only purge results of this repository")
+def purge_results(repo):
+    with db_session_factory() as db_session:
+        removed = purge_build_results(db_session, repo)
+    click.echo(f"{removed} cached result(s) removed")
+
 @cli.command()
 @click.argument("url")
 def delete(url):
@@ -33,6 +115,22 @@ def delete(url):
             click.echo("Url was deleted")
         else:
             click.echo("Url not found")
-    
+
+@cli.command()
+@click.option("--repo", default=None, help="Only show timings of this repository")
+@click.option("--days", type=int, default=7, help="How many days of build history to include")
+def timings(repo, days):
+    since = datetime.now() - timedelta(days=days)
+    with db_session_factory() as db_session:
+        rows = get_phase_percentiles(db_session, since, repo)
+    if not rows:
+        click.echo("No phase timings recorded")
+        return
+
+    rows.sort(key=lambda row: (row[0], PHASES.index(row[1]) if row[1] in PHASES else len(PHASES)))
+    click.echo(f"{'repository':<24} {'phase':<12} {'samples':>8} {'p50':>10} {'p95':>10}")
+    for name, phase, samples, p50, p95 in rows:
+        click.echo(f"{name:<24} {phase:<12} {samples:>8} {p50 / 1000:>9.1f}s {p95 / 1000:>9.1f}s")
+
 if __name__ == '__main__':
-    cli()
\ No newline at end of file
+    cli()
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class AppConfig(BaseSettings):
@@ -5,8 +6,76 @@ class AppConfig(BaseSettings):
     POSTGRES_USER: str = "postgres"
     POSTGRES_PASSWORD: str = "postgres"
     POSTGRES_HOSTNAME: str = "database"
+    DATABASE_URL: Optional[str] = None
     S3_ENDPOINT_URL: str = "http://garage:3900"
     S3_ACCESS_KEY: str
     S3_SECRET_KEY: str
     S3_DEFAULT_REGION: str = "garage"
-    TELEGRAM_BOT_TOKEN: str
\ No newline at end of file
+    S3_PUBLIC_URL: Optional[str] = None
+    PRESIGNED_URL_TTL: int = 3600
+    TELEGRAM_BOT_TOKEN: str
+    TELEGRAM_API_URL: Optional[str] = None
+    TELEGRAM_FILE_LIMIT_MB: int = 50
+    WEBHOOK_SECRET: Optional[str] = None
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 5
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    REPO_REGISTRY_TTL: int = 60
+    EMBEDDED_RUNNER: bool = True
+    RUNNER_NAME: Optional[str] = None
+    RUNNER_LABELS: list[str] = []
+    RUNNER_HEARTBEAT_INTERVAL: float = 10.0
+    RUNNER_STALE_TIMEOUT: float = 60.0
+    RUNNER_METRICS_PORT: Optional[int] = None
+    MAX_CONCURRENT_BUILDS: int = 2
+    BUILD_POLL_INTERVAL: float = 5.0
+    MAX_CONCURRENT_JOBS: int = 4
+    DEFAULT_JOB_CPUS: float = 1.0
+    DEFAULT_JOB_MEMORY_MB: int = 1024
+    DEFAULT_JOB_PIDS: int = 1024
+    HOST_CPUS: Optional[float] = None
+    HOST_MEMORY_MB: Optional[int] = None
+    HOST_RESERVED_CPUS: float = 1.0
+    HOST_RESERVED_MEMORY_MB: int = 2048
+    COALESCE_PENDING_BUILDS: bool = True
+    CANCEL_SUPERSEDED_BUILDS: bool = False
+    CANCEL_CHECK_INTERVAL: float = 5.0
+    NOTIFY_BATCH_WINDOW: float = 2.0
+    NOTIFY_GLOBAL_RATE: float = 25.0
+    NOTIFY_CHAT_RATE: float = 1.0
+    NOTIFY_MAX_RETRIES: int = 5
+    REPO_CACHE_DIR: str = "/var/cache/swompi/repos"
+    REPO_CACHE_MAX_SIZE_MB: int = 5120
+    REPO_CACHE_SHALLOW_DEPTH: int = 50
+    CONFIG_CACHE_SIZE: int = 256
+    WORKSPACE_BACKEND: str = "disk"
+    WORKSPACE_DIR: str = "/tmp"
+    WORKSPACE_TMPFS_SIZE_MB: int = 1024
+    WORKSPACE_BASE_DIR: str = "/var/cache/swompi/workspace-bases"
+    WORKSPACE_BASE_KEEP: int = 8
+    RETENTION_KEEP_BUILDS: Optional[int] = None
+    RETENTION_KEEP_DAYS: Optional[int] = None
+    RETENTION_KEEP_LATEST_SUCCESS: bool = True
+    GC_INTERVAL: int = 3600
+    GC_BATCH_SIZE: int = 500
+    GC_BLOB_GRACE_HOURS: int = 24
+    IMAGE_PULL_TTL: int = 3600
+    IMAGE_PULL_TTLS: dict[str, int] = {}
+    IMAGE_PREWARM: list[str] = []
+    IMAGE_PREWARM_INTERVAL: int = 600
+    LOG_SEGMENT_SIZE: int = 256 * 1024
+    LOG_FLUSH_INTERVAL: float = 2.0
+    ARCHIVE_FORMAT: str = "tar.zst"
+    ARCHIVE_LEVEL: Optional[int] = None
+    UPLOAD_PART_SIZE_MB: int = 8
+    UPLOAD_CONCURRENCY: int = 4
+    ARTIFACT_DEDUP: bool = True
+    ARTIFACT_INDEX_PATH: str = "/var/cache/swompi/blob-index"
+    CACHE_STATE_DIR: str = "/var/cache/swompi/build-caches"
+    CACHE_MAX_AGE_DAYS: int = 14
+    CACHE_MAX_SIZE_MB: int = 10240
+    CACHE_EVICT_INTERVAL: int = 300
+    CONTAINER_POOL: dict[str, dict] = {}
+    CONTAINER_POOL_DIR: str = "/tmp/swompi-pool"
+    CONTAINER_POOL_CHECK_INTERVAL: int = 30
@@ -0,0 +1,153 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import threading
+import docker
+
+POOL_LABEL = "swompi.pool"
+POOL_OWNER_LABEL = "swompi.pool.owner"
+IDLE_COMMAND = ["tail", "-f", "/dev/null"]
+
+class PooledContainer:
+    def __init__(self, image_name, container, slot_dir):
+        self.image_name = image_name
+        self.container = container
+        self.slot_dir = slot_dir
+
+class ContainerPool:
+    def __init__(self, config, container_limits, owner):
+        self.client = docker.from_env()
+        self.container_limits = container_limits
+        self.owner = owner
+        self.root = os.path.join(config.CONTAINER_POOL_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", owner))
+        self.settings = config.CONTAINER_POOL
+        self.check_interval = config.CONTAINER_POOL_CHECK_INTERVAL
+
+        self._lock = threading.Lock()
+        self._idle = {image_name: [] for image_name in self.settings}
+        self._last_used = {image_name: time.monotonic() for image_name in self.settings}
+        self._wakeup = threading.Event()
+
+    def start(self):
+        if not self.settings:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        self._remove_leftovers()
+        thread = threading.Thread(target=self._maintain_loop, name="swompi-container-pool", daemon=True)
+        thread.start()
+        print(f"Warm container pool started for {', '.join(self.settings)}")
+
+    def supports(self, image_name, workspace_path):
+        if image_name not in self.settings or not os.path.isdir(self.root):
+            return False
+        return os.stat(workspace_path).st_dev == os.stat(self.root).st_dev
+
+    def acquire(self, image_name):
+        with self._lock:
+            self._last_used[image_name] = time.monotonic()
+            idle = self._idle.get(image_name)
+            pooled = idle.pop() if idle else None
+        self._wakeup.set()
+        if pooled:
+            print(f"Checked out warm container {pooled.container.short_id} for {image_name}")
+        return pooled
+
+    def release(self, pooled, healthy):
+        reuse = self.settings[pooled.image_name].get("reuse", False)
+        if reuse and healthy and not os.listdir(pooled.slot_dir) and self._is_running(pooled):
+            with self._lock:
+                self._idle[pooled.image_name].append(pooled)
+            print(f"Warm container {pooled.container.short_id} returned to the pool")
+        else:
+            self._destroy(pooled)
+        self._wakeup.set()
+
+    def run(self, pooled, workspace_path, command, env_dict, log_sink):
+        _move_entries(workspace_path, pooled.slot_dir)
+        try:
+            exec_id = self.client.api.exec_create(
+                pooled.container.id,
+                command,
+                environment=env_dict,
+                workdir="/app"
+            )["Id"]
+            for stdout_chunk, stderr_chunk in self.client.api.exec_start(exec_id, stream=True, demux=True):
+                if stdout_chunk:
+                    log_sink.write_stdout(stdout_chunk)
+                if stderr_chunk:
+                    log_sink.write_stderr(stderr_chunk)
+            return self.client.api.exec_inspect(exec_id)["ExitCode"]
+        finally:
+            _move_entries(pooled.slot_dir, workspace_path)
+
+    def _is_running(self, pooled):
+        try:
+            pooled.container.reload()
+        except docker.errors.APIError:
+            return False
+        return pooled.container.status == "running"
+
+    def _maintain_loop(self):
+        while True:
+            self._wakeup.wait(self.check_interval)
+            self._wakeup.clear()
+            for image_name, settings in self.settings.items():
+                try:
+                    self._maintain(image_name, settings)
+                except Exception as e:
+                    print(f"ERROR while maintaining warm containers for {image_name}: {e}")
+
+    def _maintain(self, image_name, settings):
+        idle_timeout = settings.get("idle_timeout", 600)
+        with self._lock:
+            expired = time.monotonic() - self._last_used[image_name] > idle_timeout
+            if expired:
+                surplus, self._idle[image_name] = self._idle[image_name], []
+            else:
+                missing = settings.get("size", 1) - len(self._idle[image_name])
+
+        if expired:
+            for pooled in surplus:
+                print(f"Warm container {pooled.container.short_id} for {image_name} idled out")
+                self._destroy(pooled)
+            return
+
+        for _ in range(missing):
+            pooled = self._create(image_name)
+            with self._lock:
+                self._idle[image_name].append(pooled)
+
+    def _create(self, image_name):
+        slot_dir = os.path.join(self.root, uuid.uuid4().hex)
+        os.makedirs(slot_dir)
+        container = self.client.containers.create(
+            image=image_name,
+            entrypoint=IDLE_COMMAND,
+            volumes={slot_dir: {"bind": "/app", "mode": "rw"}},
+            working_dir="/app",
+            labels={POOL_LABEL: image_name, POOL_OWNER_LABEL: self.owner},
+            tty=False,
+            **self.container_limits
+        )
+        container.start()
+        print(f"Started warm container {container.short_id} for {image_name}")
+        return PooledContainer(image_name, container, slot_dir)
+
+    def _destroy(self, pooled):
+        try:
+            pooled.container.remove(force=True)
+        except docker.errors.APIError as e:
+            print(f"ERROR while removing warm container {pooled.container.short_id}: {e}")
+        shutil.rmtree(pooled.slot_dir, ignore_errors=True)
+
+    def _remove_leftovers(self):
+        for container in self.client.containers.list(all=True, filters={"label": f"{POOL_OWNER_LABEL}={self.owner}"}):
+            container.remove(force=True)
+        for entry in os.listdir(self.root):
+            shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
+
+def _move_entries(source_dir, destination_dir):
+    for entry in os.listdir(source_dir):
+        shutil.move(os.path.join(source_dir, entry), os.path.join(destination_dir, entry))
@@ -0,0 +1,99 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from swompi.functions import claim_pending_build, heartbeat_builds, reclaim_stale_builds, listen, BUILDS_CHANNEL
+
+class BuildDispatcher:
+    def __init__(self, db_session_factory, executor, config, engine=None):
+        self.db_session_factory = db_session_factory
+        self.executor = executor
+        self.engine = engine
+        self.max_workers = config.MAX_CONCURRENT_BUILDS
+        self.poll_interval = config.BUILD_POLL_INTERVAL
+        self.heartbeat_interval = config.RUNNER_HEARTBEAT_INTERVAL
+        self.stale_after = config.RUNNER_STALE_TIMEOUT
+        self.runner_id = executor.runner_id
+        self.labels = executor.labels
+
+        self._slots = threading.Semaphore(self.max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="swompi-build")
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="swompi-dispatcher", daemon=True)
+        self._thread.start()
+        threading.Thread(target=self._heartbeat_loop, name="swompi-heartbeat", daemon=True).start()
+        if self.engine is not None and self.engine.dialect.name == "postgresql":
+            threading.Thread(target=self._listen_loop, name="swompi-build-listener", daemon=True).start()
+
+        labels = ", ".join(self.labels) or "none"
+        print(f"Runner {self.runner_id} started with {self.max_workers} worker slot(s), labels: {labels}")
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+        self._pool.shutdown(wait=True)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._slots.acquire()
+            self._wakeup.clear()
+            if self._stop.is_set():
+                self._slots.release()
+                break
+
+            if not self.executor.capacity.wait_for_room(self.poll_interval):
+                self._slots.release()
+                continue
+
+            build_id = self._claim()
+            if build_id is None:
+                self._slots.release()
+                self._wakeup.wait(self.poll_interval)
+                continue
+
+            print(f"Dispatching build {build_id}")
+            self._pool.submit(self._run, build_id)
+
+    def _claim(self):
+        try:
+            with self.db_session_factory() as db_session:
+                return claim_pending_build(db_session, self.runner_id, self.labels)
+        except Exception as e:
+            print(f"ERROR while claiming pending build: {e}")
+            return None
+
+    def _run(self, build_id):
+        try:
+            self.executor.run_build(build_id)
+        except Exception as e:
+            print(f"ERROR in build worker for build {build_id}: {e}")
+        finally:
+            self._slots.release()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                with self.db_session_factory() as db_session:
+                    heartbeat_builds(db_session, self.runner_id)
+                    reclaimed = reclaim_stale_builds(db_session, self.stale_after)
+                if reclaimed:
+                    print(f"Reclaimed build(s) {', '.join(map(str, reclaimed))} from runners that stopped heartbeating")
+                    self.notify()
+            except Exception as e:
+                print(f"ERROR while sending runner heartbeat: {e}")
+
+    def _listen_loop(self):
+        while not self._stop.is_set():
+            try:
+                listen(self.engine, BUILDS_CHANNEL, self.notify, self.poll_interval)
+            except Exception as e:
+                print(f"ERROR in build queue listener: {e}")
+            time.sleep(self.poll_interval)
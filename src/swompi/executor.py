@@ -1,215 +1,408 @@
 import os
-import tempfile
-import yaml
-import re
+import json
+import hashlib
+import shutil
+import threading
 import time
+import socket
 import docker
-from schema import Schema, Optional, SchemaError, And, Or
-from git import Repo, GitCommandError
-from swompi.functions import update_build_status_to_running, finalize_build
+from swompi.functions import get_build, get_build_status, finalize_build, create_jobs, update_job_status, release_build, find_build_result, save_build_result
 from swompi.models import BuildStatus
-import asyncio
-from swompi.bot import send_build_notification
+from swompi.repo_cache import RepositoryMirrorCache
+from swompi.workspaces import WorkspaceManager
+from swompi.images import ImageResolver
+from swompi.logs import BuildLogSink
+from swompi.build_cache import BuildCacheManager
+from swompi.pipeline import CONFIG_FILENAME, PipelineConfigCache, plan_jobs, run_pipeline
+from swompi.filters import skip_reason
+from swompi.container_pool import ContainerPool
+from swompi.notifications import NotificationDispatcher
+from swompi.resources import HostCapacity
+from swompi.metrics import PhaseTimer, ACTIVE_BUILDS, BUILDS_FINISHED, LOG_UPLOAD_FAILURES, phase
 
 class Executor:
     def __init__(self, db_session_factory, s3_client, config):
         self.db_session_factory = db_session_factory
         self.file_storage = s3_client
         self.config = config
+        self.repo_cache = RepositoryMirrorCache(config)
+        self.workspaces = WorkspaceManager(config, self.repo_cache)
+        self.image_resolver = ImageResolver(config)
+        self.build_cache = BuildCacheManager(config)
+        self.config_cache = PipelineConfigCache(config.CONFIG_CACHE_SIZE)
+        self.runner_id = config.RUNNER_NAME or f"{socket.gethostname()}-{os.getpid()}"
+        self.labels = sorted(config.RUNNER_LABELS)
+        self.capacity = HostCapacity(config)
+        self.container_pool = ContainerPool(config, self.capacity.container_limits(self.capacity.default_request), self.runner_id)
+        self.notifications = NotificationDispatcher(db_session_factory, config)
+        self._job_slots = threading.BoundedSemaphore(config.MAX_CONCURRENT_JOBS)
+        self.cancel_check_interval = config.CANCEL_CHECK_INTERVAL
+        self._active_containers = {}
+        self._active_lock = threading.Lock()
 
-    def run_build(self, build_id, request_json):
+    def run_build(self, build_id):
         with self.db_session_factory() as db_session:
-            update_build_status_to_running(db_session, build_id)
-            repo_url = request_json['repository']['clone_url']
-            commit_sha = request_json['after']
+            build = get_build(db_session, build_id)
+            repository = build.repository
 
-            workspace_path, workspace_object = self._prepare_workspace(build_id)
+        workspaces = {}
+        workspace_objects = []
+        cancelled = threading.Event()
+        finished = threading.Event()
+        announce = True
+        timer = PhaseTimer(build_id)
+        if build.started_at and build.created_at:
+            timer.record("queue_wait", (build.started_at - build.created_at).total_seconds())
+        ACTIVE_BUILDS.inc()
+        threading.Thread(
+            target=self._watch_cancellation,
+            args=(build_id, cancelled, finished),
+            name=f"swompi-cancel-{build_id}",
+            daemon=True
+        ).start()
+        try:
+            with timer.phase("clone"):
+                blob_sha = self.repo_cache.blob_hash(repository, build.commit_sha, CONFIG_FILENAME)
+            if blob_sha is None:
+                raise Exception(f"Configuration error: {CONFIG_FILENAME} not found in the repository root")
+
+            with timer.phase("config"):
+                config_data = self.config_cache.load(blob_sha, lambda: self.repo_cache.read_blob(repository, blob_sha))
+                reason = self._check_filters(repository, build, config_data)
+                if not reason:
+                    jobs = plan_jobs(config_data)
+                    for job in jobs:
+                        job["resources"] = self.capacity.request_for(job)
+            if reason:
+                with self.db_session_factory() as db_session:
+                    finalize_build(db_session, build_id, BuildStatus.skipped, None)
+                BUILDS_FINISHED.labels(BuildStatus.skipped.value).inc()
+                print(f"Build {build_id} skipped: {reason}")
+                announce = False
+                return
+
+            required_labels = sorted({tag for job in jobs for tag in job["tags"]})
+            if not set(required_labels) <= set(self.labels):
+                with self.db_session_factory() as db_session:
+                    release_build(db_session, build_id, required_labels)
+                print(f"Build {build_id} needs runner labels {', '.join(required_labels)}, returned to the queue")
+                announce = False
+                return
+
+            fingerprint = None
+            if repository.result_cache:
+                with timer.phase("pull"):
+                    fingerprint = self._fingerprint(repository, build, jobs)
+                with self.db_session_factory() as db_session:
+                    result = find_build_result(db_session, repository.id, fingerprint)
+                    cached_from = result.build_id if result else None
+                    if result:
+                        finalize_build(db_session, build_id, BuildStatus.success, result.log_key, result.artifacts_key, cached_from)
+                if cached_from:
+                    BUILDS_FINISHED.labels(BuildStatus.success.value).inc()
+                    print(f"Build {build_id} has the same inputs as build {cached_from}, reusing its result")
+                    return
+
+            for job in jobs:
+                with timer.phase("clone", job["name"]):
+                    workspace = self.workspaces.checkout(build_id, repository, build.commit_sha)
+                workspace_objects.append(workspace)
+                workspaces[job["name"]] = workspace.path
+
+            with self.db_session_factory() as db_session:
+                job_ids = create_jobs(db_session, build_id, jobs)
+
+            jobs_by_name = {job["name"]: job for job in jobs}
+            statuses = run_pipeline(
+                jobs,
+                lambda job: self._run_job(build, job, job_ids[job["name"]], jobs_by_name, workspaces, timer),
+                len(jobs),
+                cancelled
+            )
+            with self.db_session_factory() as db_session:
+                for name, status in statuses.items():
+                    if status in (BuildStatus.skipped, BuildStatus.cancelled):
+                        update_job_status(db_session, job_ids[name], status)
+
+            if cancelled.is_set():
+                build_status = BuildStatus.cancelled
+            elif all(status == BuildStatus.success for status in statuses.values()):
+                build_status = BuildStatus.success
+            else:
+                build_status = BuildStatus.failed
 
+            log_key, artifacts_key = self._upload_results(build_id, jobs, statuses, workspaces, workspace_objects, timer)
+            with self.db_session_factory() as db_session:
+                finalize_build(db_session, build_id, build_status, log_key, artifacts_key)
+                if fingerprint and build_status == BuildStatus.success:
+                    save_build_result(db_session, repository.id, fingerprint, build_id, log_key, artifacts_key)
+            BUILDS_FINISHED.labels(build_status.value).inc()
+            print(f"Build {build_id} finished: " + ", ".join(f"{name}={status.value}" for name, status in statuses.items()))
+
+        except Exception as e:
+            print(f"ERROR during build {build_id}: {e}")
+            self._mark_build_as_failed(build_id, str(e))
+            BUILDS_FINISHED.labels(BuildStatus.failed.value).inc()
+        finally:
+            finished.set()
+            ACTIVE_BUILDS.dec()
             try:
-                self._clone_repo(repo_url, commit_sha, workspace_path)
-                config_data = self._read_and_validate_config(workspace_path)
-                env_dict = self._create_enviroment_dict(workspace_path, request_json, config_data, build_id)
-                self._create_build_script(workspace_path, config_data)
-                self._run_docker_container(build_id, workspace_path, config_data, env_dict)
-                print(config_data)
-                if config_data["artifacts"]["paths"]:
-                    log_key = self.file_storage.upload_logs_and_artifacts(build_id, workspace_path, config_data["artifacts"]["paths"])
-                else:
-                    log_key = self.file_storage.upload_logs_and_artifacts(build_id, workspace_path)
-                finalize_build(db_session, build_id, BuildStatus.success, log_key)
-                    
+                timer.save(self.db_session_factory)
             except Exception as e:
-                print(f"ERROR during build {build_id}: {e}")
-                self._mark_build_as_failed(build_id, str(e))
-            finally:
-                self._cleanup_workspace(workspace_object)
-                asyncio.run(send_build_notification(build_id))
+                print(f"ERROR while saving phase timings of build {build_id}: {e}")
+            for workspace in workspace_objects:
+                self.workspaces.release(workspace)
+            if announce:
+                self.notifications.enqueue(build_id)
+            self.build_cache.evict()
 
-    def _prepare_workspace(self, build_id):
-        workspace_path = tempfile.TemporaryDirectory(prefix=f"swompi_build_{build_id}_")
+    def _check_filters(self, repository, build, config_data):
+        if not ("only" in config_data or "except" in config_data):
+            return None
 
-        return workspace_path.name, workspace_path
+        only, except_ = config_data.get("only") or {}, config_data.get("except") or {}
+        changed_paths = None
+        if "changes" in only or "changes" in except_:
+            changed_paths = json.loads(build.changed_paths) if build.changed_paths is not None else None
+            if changed_paths is None:
+                changed_paths = self.repo_cache.changed_paths(repository, build.before_sha, build.commit_sha)
+        return skip_reason(only, except_, build.ref_name, changed_paths)
 
-    def _clone_repo(self, repo_url, commit_sha, workspace_path):
-        try:
-            print(f"Cloning {repo_url} into {workspace_path}")
-            repo = Repo.clone_from(repo_url, workspace_path)
-            print(f"Checking out commit {commit_sha}")
-            repo.git.checkout(commit_sha)
-        except GitCommandError as e:
-            raise RuntimeError(f"Failed to clone repo or checkout commit: {e}")
-
-    def _read_and_validate_config(self, workspace_path):
-        non_empty_list_of_strings = And([str], lambda l: len(l) > 0, error='This list cannot be empty')
-
-        valid_image_name = And(str, lambda s: not re.search(r'\s', s), error='Image name cannot contain whitespace')
-
-        CONFIG_SCHEMA = Schema({
-            "image": valid_image_name,
-            Optional("variables"): {str: Or(int, str)},
-            Optional("before_script"): [str],
-            "scripts": non_empty_list_of_strings,
-            Optional("after_script"): [str],
-            Optional("artifacts"): {
-                "paths": non_empty_list_of_strings
-            }
-        })
-
-        file_path = self._find_config_file(workspace_path)
+    def _fingerprint(self, repository, build, jobs):
+        inputs = {"tree": self.repo_cache.tree_hash(repository, build.commit_sha), "jobs": []}
+        for job in jobs:
+            try:
+                image_id = self.image_resolver.ensure(job["image"]).id
+            except docker.errors.NotFound:
+                raise RuntimeError(f"Docker image {job['image']} not found")
+            inputs["jobs"].append(dict(job, image=image_id))
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
 
-        try:
-            with open(file_path, 'r') as f:
-                configuration = yaml.safe_load(f)
+    def _watch_cancellation(self, build_id, cancelled, finished):
+        while not finished.wait(self.cancel_check_interval):
+            try:
+                with self.db_session_factory() as db_session:
+                    status = get_build_status(db_session, build_id)
+            except Exception as e:
+                print(f"ERROR while checking build {build_id} for cancellation: {e}")
+                continue
 
-            if configuration is None:
-                raise Exception("Configuration file is empty or invalid.")
+            if status == BuildStatus.cancelled.value:
+                print(f"Build {build_id} was superseded by a newer push, stopping its containers")
+                cancelled.set()
+                self._stop_containers(build_id)
+                return
 
-            CONFIG_SCHEMA.validate(configuration)
-            
-            print(f"Configuration file {file_path} is valid.")
-            return configuration
+    def _track_container(self, build_id, container):
+        with self._active_lock:
+            self._active_containers.setdefault(build_id, set()).add(container)
+
+    def _untrack_container(self, build_id, container):
+        with self._active_lock:
+            containers = self._active_containers.get(build_id, set())
+            containers.discard(container)
+            if not containers:
+                self._active_containers.pop(build_id, None)
+
+    def _stop_containers(self, build_id):
+        with self._active_lock:
+            containers = list(self._active_containers.get(build_id, ()))
+        for container in containers:
+            try:
+                container.kill()
+                print(f"Container {container.short_id} of build {build_id} stopped")
+            except docker.errors.APIError as e:
+                print(f"ERROR while stopping container {container.short_id} of build {build_id}: {e}")
+
+    def _run_job(self, build, job, job_id, jobs_by_name, workspaces, timer=None):
+        workspace_path = workspaces[job["name"]]
+        with self.db_session_factory() as db_session:
+            update_job_status(db_session, job_id, BuildStatus.running)
 
-        except yaml.YAMLError as e:
-            raise Exception(f"YAML syntax error: {e}")
-        except SchemaError as e:
-            raise Exception(f"Configuration error: {e}")
+        exit_code = None
+        try:
+            self._copy_needed_artifacts(job, jobs_by_name, workspaces)
+            env_dict = self._create_enviroment_dict(workspace_path, build, job)
+            self._create_build_script(workspace_path, job)
+            cache_volumes = self.build_cache.volumes_for(build.repository_id, job.get("cache"), workspace_path)
+            with self.capacity.reserve(job["resources"]), self._job_slots:
+                exit_code = self._run_docker_container(build.id, job["name"], workspace_path, job, env_dict, cache_volumes, timer)
         except Exception as e:
-            raise Exception(f"ERROR during read configuration {e}")
-
-    def _find_config_file(self, workspace_path):
-        config_filename = '.swompi.yml'
-        for root, dirs, files in os.walk(workspace_path):
-            if config_filename in files:
-                return os.path.join(root, config_filename)
-            break 
-        return None
-
-        if len(result) > 1:
-            raise Exception("Found multiple .swompi.yml files in root directory")
-        if len(result) < 1:
-            raise Exception("Not found .swompi.yml files in root directory")
-        
-        return result[0]
-
-    def _create_enviroment_dict(self, workspace_path, request_json, config_data, build_id):
+            with open(os.path.join(workspace_path, "build.log"), "a", encoding="utf-8") as f:
+                f.write(f"SWOMPI: {e}\n")
+            raise
+        finally:
+            status = BuildStatus.success if exit_code == 0 else BuildStatus.failed
+            with self.db_session_factory() as db_session:
+                update_job_status(db_session, job_id, status, exit_code)
+
+        return exit_code == 0
+
+    def _copy_needed_artifacts(self, job, jobs_by_name, workspaces):
+        workspace_path = workspaces[job["name"]]
+        for needed in job["needs"]:
+            source_root = workspaces[needed]
+            for artifact in jobs_by_name[needed].get("artifacts", {}).get("paths", []):
+                source = os.path.join(source_root, artifact)
+                destination = os.path.join(workspace_path, artifact)
+                if os.path.isdir(source):
+                    shutil.copytree(source, destination, dirs_exist_ok=True)
+                elif os.path.isfile(source):
+                    os.makedirs(os.path.dirname(destination), exist_ok=True)
+                    shutil.copy2(source, destination)
+                print(f"Artifact {artifact} of job {needed} passed to job {job['name']}")
+
+    def _upload_results(self, build_id, jobs, statuses, workspaces, workspace_objects, timer=None):
+        if len(jobs) == 1:
+            job = jobs[0]
+            outputs = [("", workspaces[job["name"]], job.get("artifacts", {}).get("paths"))]
+            return self.file_storage.upload_logs_and_artifacts(build_id, outputs, timer)
+
+        summary_workspace = self.workspaces.create(build_id)
+        workspace_objects.append(summary_workspace)
+        summary_path = summary_workspace.path
+        with open(os.path.join(summary_path, "build.log"), "wb") as summary:
+            for job in jobs:
+                summary.write(f"===== Job {job['name']} ({job['stage']}): {statuses[job['name']].value} =====\n".encode("utf-8"))
+                job_log = os.path.join(workspaces[job["name"]], "build.log")
+                if os.path.exists(job_log):
+                    with open(job_log, "rb") as f:
+                        shutil.copyfileobj(f, summary)
+
+        outputs = [("", summary_path, None)]
+        for job in jobs:
+            artifacts = job.get("artifacts", {}).get("paths") if statuses[job["name"]] == BuildStatus.success else None
+            outputs.append((f"{job['name']}/", workspaces[job["name"]], artifacts))
+        return self.file_storage.upload_logs_and_artifacts(build_id, outputs, timer)
+
+    def _create_enviroment_dict(self, workspace_path, build, job):
         env_dict = {
-            "CI_COMMIT_SHA": request_json['after'],
-            "CI_COMMIT_MESSAGE": request_json['head_commit']['message'],
-            "CI_COMMIT_AUTHOR": request_json['head_commit']['author']['username'],
+            "CI_COMMIT_SHA": build.commit_sha,
+            "CI_COMMIT_MESSAGE": build.commit_message,
+            "CI_COMMIT_AUTHOR": build.commit_author,
             "CI_PROJECT_DIR": "/app",
-            "CI_REPO_URL": request_json['repository']['html_url'],
-            "CI_BUILD_ID": build_id,
+            "CI_REPO_URL": self._html_url(build.repository.url),
+            "CI_BUILD_ID": build.id,
             "CI_SERVER_NAME": "Swompi-Runner",
-            "CI_COMMIT_REF_NAME": self._parse_ref(request_json['ref'])
+            "CI_COMMIT_REF_NAME": build.ref_name,
+            "CI_JOB_NAME": job["name"],
+            "CI_JOB_STAGE": job["stage"]
         }
 
-        env_dict = env_dict | config_data["variables"]
+        env_dict = env_dict | job.get("variables", {})
         print(f"Enviroment dictionary succesfully created")
         return env_dict
 
-    def _parse_ref(self, ref_string):
-        parts = ref_string.split('/')
-        if len(parts) < 3 or parts[0] != 'refs':
-            return None
-        return '/'.join(parts[2:])
+    def _html_url(self, clone_url):
+        return clone_url[:-4] if clone_url.endswith(".git") else clone_url
 
-    def _create_build_script(self, workspace_path, config_data):
+    def _create_build_script(self, workspace_path, job):
         script_file_path = os.path.join(workspace_path, "_run.sh")
         with open(script_file_path, "w") as f:
             f.write("set -e\n")
-            for command in config_data["before_script"]:
+            for command in job.get("before_script", []):
                 f.write(f"{command}\n")
 
-            for command in config_data["scripts"]:
+            for command in job["scripts"]:
                 f.write(f"{command}\n")
         print(f"Script file succesfully created {script_file_path}")
 
-    def _run_docker_container(self, build_id, workspace_path, config_data, env_dict):
+    def _run_docker_container(self, build_id, job_name, workspace_path, job, env_dict, cache_volumes, timer=None):
         client = docker.from_env()
-        image_name = config_data["image"]
+        image_name = job["image"]
 
-        print(f"Pulling Docker image {image_name}")
         try:
-            client.images.pull(image_name)
-            print(f"Image {image_name} pulled successfully")
-        except docker.error.ImageNotFound:
-            self._mark_build_as_failed(build_id, f"Docker image {image_name} not found")
-            return
+            with phase(timer, "pull", job_name):
+                self.image_resolver.ensure(image_name)
+        except docker.errors.NotFound:
+            raise RuntimeError(f"Docker image {image_name} not found")
+
+        if not cache_volumes and job["resources"] == self.capacity.default_request and self.container_pool.supports(image_name, workspace_path):
+            pooled = self.container_pool.acquire(image_name)
+            if pooled:
+                with phase(timer, "run", job_name):
+                    return self._run_in_pooled_container(build_id, job_name, workspace_path, pooled, env_dict)
 
         volume = {workspace_path: {
             "bind": "/app",
             "mode": "rw"
-        }}
+        }} | cache_volumes
         cmd = ["sh", "/app/_run.sh"]
         container = None
         try:
             container = client.containers.create(
-                image=config_data["image"],
+                image=image_name,
                 command=cmd,
                 environment=env_dict,
                 volumes=volume,
                 working_dir='/app',
-                tty=False
+                labels={"swompi.build": str(build_id), "swompi.job": job_name},
+                tty=False,
+                **self.capacity.container_limits(job["resources"])
             )
-            
-            container.start()
-            
-            log_stream = container.logs(stream=True, stdout=True, stderr=True)
-            
-            print("Container is running, capturing logs...")
-            log_file_path = os.path.join(workspace_path, "build.log")
-            
-            with open(log_file_path, "w", encoding="utf-8") as f:
-                for log_chunk in log_stream:
-                    line = log_chunk.decode('utf-8')
-                    if line.endswith("stderr\n"):
-                        f.write(f"STDERR: {line[:-8]}\n")
-                    else:
-                        f.write(f"STDOUT: {line}")
-
-            result = container.wait()
+            self._track_container(build_id, container)
+
+            with phase(timer, "run", job_name):
+                container.start()
+
+                log_stream = container.attach(stdout=True, stderr=True, stream=True, logs=True, demux=True)
+
+                print(f"Container for job {job_name} is running, capturing logs...")
+                log_file_path = os.path.join(workspace_path, "build.log")
+
+                with BuildLogSink(self.file_storage, build_id, job_name, log_file_path, self.config) as log_sink:
+                    for stdout_chunk, stderr_chunk in log_stream:
+                        if stdout_chunk:
+                            log_sink.write_stdout(stdout_chunk)
+                        if stderr_chunk:
+                            log_sink.write_stderr(stderr_chunk)
+                self._check_log_upload(log_sink, log_file_path)
+
+                result = container.wait()
             exit_code = result['StatusCode']
             
-            print(f"Container finished with exit code: {exit_code}")
-            print(f"Log file available here: {log_file_path}")
-
-            if exit_code != 0:
-                self._mark_build_as_failed(build_id, "Error during build. Check logs for more.")
+            print(f"Container for job {job_name} finished with exit code: {exit_code}")
+            return exit_code
 
         except docker.errors.ImageNotFound as e:
-            self._mark_build_as_failed(build_id, e)
+            raise RuntimeError(f"Docker image {image_name} not found: {e}")
         except Exception as e:
             raise Exception(f"ERROR during running docker container: {e}")
 
         finally:
             if container:
+                self._untrack_container(build_id, container)
                 container.remove()
 
+    def _run_in_pooled_container(self, build_id, job_name, workspace_path, pooled, env_dict):
+        log_file_path = os.path.join(workspace_path, "build.log")
+        healthy = False
+        self._track_container(build_id, pooled.container)
+        try:
+            print(f"Running job {job_name} in warm container {pooled.container.short_id}, capturing logs...")
+            with BuildLogSink(self.file_storage, build_id, job_name, log_file_path, self.config) as log_sink:
+                exit_code = self.container_pool.run(pooled, workspace_path, ["sh", "/app/_run.sh"], env_dict, log_sink)
+            healthy = True
+            self._check_log_upload(log_sink, log_file_path)
+
+            print(f"Job {job_name} finished in warm container with exit code: {exit_code}")
+            return exit_code
+
+        except Exception as e:
+            raise Exception(f"ERROR during running docker container: {e}")
+
+        finally:
+            self._untrack_container(build_id, pooled.container)
+            self.container_pool.release(pooled, healthy)
+
+    def _check_log_upload(self, log_sink, log_file_path):
+        if log_sink.upload_error is None:
+            return
+        LOG_UPLOAD_FAILURES.inc()
+        with open(log_file_path, "a", encoding="utf-8") as f:
+            f.write(f"SWOMPI: {log_sink.upload_error}, the complete log is in the build archive\n")
+
     def _mark_build_as_failed(self, build_id, error):
         with self.db_session_factory() as db_session:
             finalize_build(db_session, build_id, BuildStatus.failed, "None")
-            print(f"Marking build {build_id} as FAILED. Reason: {error}")
-
-    def _cleanup_workspace(self, workspace_path):
-        print(f"Cleaning up workspace: {workspace_path.name}")
-        workspace_path.cleanup()
\ No newline at end of file
+            print(f"Marking build {build_id} as FAILED. Reason: {error}")
\ No newline at end of file
@@ -0,0 +1,57 @@
+import re
+from functools import lru_cache
+
+@lru_cache(maxsize=1024)
+def glob_pattern(glob):
+    if glob.endswith("/"):
+        glob += "**"
+    regex = ""
+    i = 0
+    while i < len(glob):
+        if glob.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif glob.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif glob[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif glob[i] == "?":
+            regex += "[^/]"
+            i += 1
+        else:
+            regex += re.escape(glob[i])
+            i += 1
+    return re.compile(regex + r"\Z")
+
+def matches_any(value, globs):
+    return any(glob_pattern(glob).match(value) for glob in globs)
+
+def skip_reason(only, except_, ref_name, changed_paths):
+    only = only or {}
+    except_ = except_ or {}
+
+    if "refs" in only and not matches_any(ref_name, only["refs"]):
+        return f"ref {ref_name} is not listed in only.refs"
+    if "refs" in except_ and matches_any(ref_name, except_["refs"]):
+        return f"ref {ref_name} is listed in except.refs"
+
+    if changed_paths is None:
+        return None
+    if "changes" in only and not any(matches_any(path, only["changes"]) for path in changed_paths):
+        return "no changed path matches only.changes"
+    if "changes" in except_ and changed_paths and all(matches_any(path, except_["changes"]) for path in changed_paths):
+        return "every changed path matches except.changes"
+    return None
+
+def collect_changed_paths(commits):
+    if not commits:
+        return None
+    paths = set()
+    for commit in commits:
+        for key in ("added", "removed", "modified"):
+            if key not in commit:
+                return None
+            paths.update(commit[key])
+    return sorted(paths)
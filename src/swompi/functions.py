@@ -1,13 +1,31 @@
-from sqlalchemy import select, update, delete, desc
+import json
+import select as io_select
+from contextlib import contextmanager
+from datetime import timedelta
+from sqlalchemy import select, update, delete, desc, or_, tuple_, inspect, text, func
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
+from alembic import command
+from alembic.config import Config
 from swompi.models import *
 from swompi.session import engine 
 
+BASELINE_REVISION = "0001"
+REPOSITORIES_CHANNEL = "swompi_repositories"
+BUILDS_CHANNEL = "swompi_builds"
+CLAIM_BATCH_SIZE = 20
+
 def initialize_database():
     print("Initializing database...")
-    
-    Base.metadata.create_all(bind=engine)
+
+    alembic_config = Config()
+    alembic_config.set_main_option("script_location", "swompi:migrations")
+    tables = inspect(engine).get_table_names()
+    if "builds" in tables and "alembic_version" not in tables:
+        print(f"Existing schema found, marking it as revision {BASELINE_REVISION}")
+        command.stamp(alembic_config, BASELINE_REVISION)
+    command.upgrade(alembic_config, "head")
     
     print("Database initialized successfully.")
 
@@ -20,13 +38,16 @@ def add_user(db: Session, user: str, chat: str) -> None:
     db.commit()
     db.refresh(new_user)
 
-def create_repo(db: Session, url: str, name: str) -> None:
+def create_repo(db: Session, url: str, name: str, clone_mode: str = "full", clone_depth: Optional[int] = None) -> None:
     new_repo = Repository(
         url=url, 
         name=name, 
-        created_at=datetime.now().replace(microsecond=0)
+        created_at=datetime.now().replace(microsecond=0),
+        clone_mode=clone_mode,
+        clone_depth=clone_depth
     )
     db.add(new_repo)
+    _notify_repositories_changed(db)
     db.commit()
     db.refresh(new_repo)
 
@@ -36,9 +57,67 @@ def delete_repo(db: Session, url: str) -> bool:
         return False
 
     db.delete(repo_to_delete)
+    _notify_repositories_changed(db)
     db.commit()
     return True
 
+def _notify_repositories_changed(db: Session) -> None:
+    _notify(db, REPOSITORIES_CHANNEL)
+
+def _notify(db: Session, channel: str) -> None:
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"NOTIFY {channel}"))
+
+def listen(engine, channel: str, on_notify, timeout: float) -> None:
+    connection = engine.raw_connection()
+    try:
+        dbapi_connection = connection.dbapi_connection
+        dbapi_connection.autocommit = True
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {channel}")
+        print(f"Listening for notifications on {channel}")
+
+        while True:
+            if io_select.select([dbapi_connection], [], [], timeout) == ([], [], []):
+                continue
+            dbapi_connection.poll()
+            if dbapi_connection.notifies:
+                dbapi_connection.notifies.clear()
+                on_notify()
+    finally:
+        connection.invalidate()
+
+def update_repo_clone_mode(db: Session, url: str, clone_mode: str, clone_depth: Optional[int] = None) -> bool:
+    stmt = update(Repository).where(Repository.url == url).values(
+        clone_mode=clone_mode,
+        clone_depth=clone_depth
+    )
+    result = db.execute(stmt)
+    db.commit()
+    return result.rowcount > 0
+
+def update_repo_result_cache(db: Session, url: str, enabled: bool) -> bool:
+    stmt = update(Repository).where(Repository.url == url).values(result_cache=enabled)
+    result = db.execute(stmt)
+    db.commit()
+    return result.rowcount > 0
+
+def update_repo_retention(db: Session, url: str, keep_builds: Optional[int], keep_days: Optional[int], keep_latest_success: Optional[bool]) -> bool:
+    stmt = update(Repository).where(Repository.url == url).values(
+        keep_builds=keep_builds,
+        keep_days=keep_days,
+        keep_latest_success=keep_latest_success
+    )
+    result = db.execute(stmt)
+    db.commit()
+    return result.rowcount > 0
+
+def update_repo_workspace_backend(db: Session, url: str, backend: Optional[str]) -> bool:
+    stmt = update(Repository).where(Repository.url == url).values(workspace_backend=backend)
+    result = db.execute(stmt)
+    db.commit()
+    return result.rowcount > 0
+
 def get_all_repos(db: Session) -> List[Repository]:
     stmt = select(Repository)
     result = db.execute(stmt)
@@ -48,6 +127,68 @@ def get_repo_by_url(db: Session, url: str) -> Optional[Repository]:
     stmt = select(Repository).where(Repository.url == url)
     result = db.execute(stmt)
     return result.scalar_one_or_none()
+
+def get_repo_ids_by_url(db: Session) -> dict:
+    stmt = select(Repository.url, Repository.id)
+    result = db.execute(stmt)
+    return dict(result.all())
+
+def get_repo_by_name(db: Session, name: str) -> Optional[Repository]:
+    stmt = select(Repository).where(Repository.name == name).order_by(Repository.id).limit(1)
+    result = db.execute(stmt)
+    return result.scalar_one_or_none()
+
+def get_user_by_chat(db: Session, chat_id: str) -> Optional[User]:
+    stmt = select(User).where(User.chat_id == chat_id).order_by(User.id).limit(1)
+    result = db.execute(stmt)
+    return result.scalar_one_or_none()
+
+def subscribe(db: Session, user_id: int, repository_id: int, ref_name: Optional[str], failures_only: bool) -> None:
+    stmt = select(Subscription).where(
+        Subscription.user_id == user_id,
+        Subscription.repository_id == repository_id,
+        Subscription.ref_name.is_(None) if ref_name is None else Subscription.ref_name == ref_name
+    )
+    subscription = db.execute(stmt).scalar_one_or_none()
+    if subscription is None:
+        subscription = Subscription(user_id=user_id, repository_id=repository_id, ref_name=ref_name)
+        db.add(subscription)
+    subscription.failures_only = failures_only
+    db.commit()
+
+def unsubscribe(db: Session, user_id: int, repository_id: int, ref_name: Optional[str] = None) -> int:
+    stmt = delete(Subscription).where(Subscription.user_id == user_id, Subscription.repository_id == repository_id)
+    if ref_name is not None:
+        stmt = stmt.where(Subscription.ref_name == ref_name)
+    result = db.execute(stmt)
+    db.commit()
+    return result.rowcount
+
+def get_user_subscriptions(db: Session, user_id: int) -> List[Subscription]:
+    stmt = (
+        select(Subscription)
+        .join(Repository)
+        .where(Subscription.user_id == user_id)
+        .order_by(Repository.name, Subscription.ref_name)
+    )
+    result = db.execute(stmt)
+    return list(result.scalars().all())
+
+def get_subscribed_chats(db: Session, repository_id: int, ref_name: str, status: BuildStatus) -> List[str]:
+    stmt = (
+        select(User.chat_id)
+        .join(Subscription, Subscription.user_id == User.id)
+        .where(
+            Subscription.repository_id == repository_id,
+            or_(Subscription.ref_name.is_(None), Subscription.ref_name == ref_name),
+            User.chat_id.is_not(None)
+        )
+        .distinct()
+    )
+    if status != BuildStatus.failed:
+        stmt = stmt.where(Subscription.failures_only.is_(False))
+    result = db.execute(stmt)
+    return list(result.scalars().all())
     
 def create_build(
     db: Session,
@@ -55,7 +196,9 @@ def create_build(
     commit_sha: str,
     commit_message: str,
     commit_author: str,
-    ref_name: str
+    ref_name: str,
+    before_sha: Optional[str] = None,
+    changed_paths: Optional[List[str]] = None
 ) -> int:
     new_build = Build(
         repository_id=repository_id,
@@ -63,18 +206,96 @@ def create_build(
         commit_message=commit_message,
         commit_author=commit_author,
         ref_name=ref_name,
+        before_sha=before_sha,
+        changed_paths=json.dumps(changed_paths) if changed_paths is not None else None,
         status=BuildStatus.pending,
         created_at=datetime.now().replace(microsecond=0)
     )
     db.add(new_build)
+    _notify(db, BUILDS_CHANNEL)
     db.commit()
     db.refresh(new_build)
     return new_build.id 
 
-def update_build_status_to_running(db: Session, build_id: int) -> None:
+def get_build(db: Session, build_id: int) -> Optional[Build]:
+    stmt = select(Build).where(Build.id == build_id)
+    result = db.execute(stmt)
+    return result.scalar_one_or_none()
+
+def get_builds(db: Session, build_ids: List[int]) -> List[Build]:
+    stmt = select(Build).where(Build.id.in_(build_ids)).order_by(Build.id)
+    result = db.execute(stmt)
+    return list(result.scalars().all())
+
+def claim_pending_build(db: Session, runner_id: Optional[str] = None, labels: List[str] = ()) -> Optional[int]:
+    stmt = (
+        select(Build.id, Build.required_labels)
+        .where(Build.status == BuildStatus.pending)
+        .order_by(Build.created_at, Build.id)
+        .limit(CLAIM_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    candidates = db.execute(stmt).all()
+    build_id = next((id for id, required in candidates if labels_satisfied(required, labels)), None)
+    if build_id is None:
+        db.rollback()
+        return None
+
+    update_build_status_to_running(db, build_id, runner_id)
+    return build_id
+
+def labels_satisfied(required_labels: Optional[str], labels: List[str]) -> bool:
+    return not required_labels or set(required_labels.split(",")) <= set(labels)
+
+def release_build(db: Session, build_id: int, required_labels: List[str]) -> None:
+    db.execute(delete(Job).where(Job.build_id == build_id))
+    stmt = update(Build).where(Build.id == build_id, Build.status == BuildStatus.running).values(
+        status=BuildStatus.pending,
+        started_at=None,
+        runner_id=None,
+        heartbeat_at=None,
+        required_labels=",".join(sorted(required_labels)) or None
+    )
+    db.execute(stmt)
+    _notify(db, BUILDS_CHANNEL)
+    db.commit()
+
+def heartbeat_builds(db: Session, runner_id: str) -> int:
+    stmt = update(Build).where(Build.runner_id == runner_id, Build.status == BuildStatus.running).values(
+        heartbeat_at=func.now()
+    )
+    result = db.execute(stmt)
+    db.commit()
+    return result.rowcount
+
+def reclaim_stale_builds(db: Session, stale_after: float) -> List[int]:
+    stmt = select(Build.id).where(
+        Build.status == BuildStatus.running,
+        or_(Build.heartbeat_at.is_(None), Build.heartbeat_at < func.now() - timedelta(seconds=stale_after))
+    ).with_for_update(skip_locked=True)
+    stale = list(db.execute(stmt).scalars().all())
+    if not stale:
+        db.rollback()
+        return []
+
+    db.execute(delete(Job).where(Job.build_id.in_(stale)))
+    stmt = update(Build).where(Build.id.in_(stale)).values(
+        status=BuildStatus.pending,
+        started_at=None,
+        runner_id=None,
+        heartbeat_at=None
+    )
+    db.execute(stmt)
+    _notify(db, BUILDS_CHANNEL)
+    db.commit()
+    return stale
+
+def update_build_status_to_running(db: Session, build_id: int, runner_id: Optional[str] = None) -> None:
     stmt = update(Build).where(Build.id == build_id).values(
         status=BuildStatus.running,
-        started_at=datetime.now().replace(microsecond=0)
+        started_at=datetime.now().replace(microsecond=0),
+        runner_id=runner_id,
+        heartbeat_at=func.now()
     )
     db.execute(stmt)
     db.commit()
@@ -84,31 +305,250 @@ def finalize_build(
     build_id: int,
     status: BuildStatus, 
     log_key: str,
-    artifacts_key: Optional[str] = None
+    artifacts_key: Optional[str] = None,
+    cached_from: Optional[int] = None
 ) -> None:
     stmt = update(Build).where(Build.id == build_id).values(
-        status=status,
         log_key=log_key,
         artifacts_key=artifacts_key,
+        cached_from=cached_from,
         finished_at=datetime.now().replace(microsecond=0)
     )
     db.execute(stmt)
+    stmt = update(Build).where(Build.id == build_id, Build.status != BuildStatus.cancelled).values(status=status)
+    db.execute(stmt)
     db.commit()    
 
+def cancel_superseded_builds(db: Session, build_id: int, include_running: bool = False) -> List[int]:
+    build = db.get(Build, build_id)
+    statuses = [BuildStatus.pending, BuildStatus.running] if include_running else [BuildStatus.pending]
+    stmt = select(Build.id).where(
+        Build.repository_id == build.repository_id,
+        Build.ref_name == build.ref_name,
+        Build.id < build.id,
+        Build.status.in_(statuses)
+    ).with_for_update(skip_locked=True)
+    superseded = list(db.execute(stmt).scalars().all())
+    if not superseded:
+        db.rollback()
+        return []
+
+    stmt = update(Build).where(Build.id.in_(superseded), Build.status.in_(statuses)).values(
+        status=BuildStatus.cancelled,
+        finished_at=datetime.now().replace(microsecond=0)
+    )
+    db.execute(stmt)
+
+    # The new build has to cover the changes of the builds it replaces, or path filters could skip them
+    stmt = select(Build.before_sha, Build.changed_paths).where(Build.id.in_(superseded)).order_by(Build.id)
+    replaced = db.execute(stmt).all()
+    build.before_sha = replaced[0].before_sha
+    if build.changed_paths is not None and all(row.changed_paths is not None for row in replaced):
+        paths = set(json.loads(build.changed_paths))
+        for row in replaced:
+            paths.update(json.loads(row.changed_paths))
+        build.changed_paths = json.dumps(sorted(paths))
+    else:
+        build.changed_paths = None
+    db.commit()
+    return superseded
+
+def create_jobs(db: Session, build_id: int, jobs: List[dict]) -> dict:
+    new_jobs = [
+        Job(
+            build_id=build_id,
+            name=job["name"],
+            stage=job["stage"],
+            image=job["image"],
+            status=BuildStatus.pending
+        )
+        for job in jobs
+    ]
+    db.add_all(new_jobs)
+    db.commit()
+    return {job.name: job.id for job in new_jobs}
+
+def update_job_status(db: Session, job_id: int, status: BuildStatus, exit_code: Optional[int] = None) -> None:
+    values = {"status": status}
+    if status == BuildStatus.running:
+        values["started_at"] = datetime.now().replace(microsecond=0)
+    else:
+        values["exit_code"] = exit_code
+        values["finished_at"] = datetime.now().replace(microsecond=0)
+
+    stmt = update(Job).where(Job.id == job_id).values(**values)
+    db.execute(stmt)
+    db.commit()
+
+def get_build_jobs(db: Session, build_id: int) -> List[Job]:
+    stmt = select(Job).where(Job.build_id == build_id).order_by(Job.id)
+    result = db.execute(stmt)
+    return list(result.scalars().all())
+
 def get_latest_builds_by_repo(db: Session, repository_name: str,
-    limit: int = 10
+    limit: int = 10,
+    before_build_id: Optional[int] = None
 ) -> List[Build]:   
     stmt = (
         select(Build)
         .join(Repository)
         .where(Repository.name == repository_name)
-        .order_by(desc(Build.created_at))
+        .order_by(desc(Build.created_at), desc(Build.id))
         .limit(limit)
     )
+    if before_build_id is not None:
+        cursor = db.execute(select(Build.created_at, Build.id).where(Build.id == before_build_id)).first()
+        if cursor is None:
+            return []
+        stmt = stmt.where(tuple_(Build.created_at, Build.id) < tuple_(*cursor))
     
     result = db.execute(stmt)
     return list(result.scalars().all())
 
+def add_build_phases(db: Session, build_id: int, records: List[dict]) -> None:
+    db.add_all(BuildPhase(build_id=build_id, **record) for record in records)
+    db.commit()
+
+def count_builds_by_status(db: Session, statuses: List[BuildStatus]) -> dict:
+    stmt = select(Build.status, func.count()).where(Build.status.in_(statuses)).group_by(Build.status)
+    result = db.execute(stmt)
+    return dict(result.all())
+
+def count_builds_started_since(db: Session, since: datetime) -> int:
+    stmt = select(func.count()).select_from(Build).where(or_(Build.status == BuildStatus.running, Build.started_at >= since))
+    return db.execute(stmt).scalar()
+
+def get_phase_percentiles(db: Session, since: datetime, repository_name: Optional[str] = None) -> List[tuple]:
+    stmt = (
+        select(
+            Repository.name,
+            BuildPhase.phase,
+            func.count(),
+            func.percentile_cont(0.5).within_group(BuildPhase.duration_ms),
+            func.percentile_cont(0.95).within_group(BuildPhase.duration_ms)
+        )
+        .join(Build, BuildPhase.build_id == Build.id)
+        .join(Repository, Build.repository_id == Repository.id)
+        .where(Build.created_at >= since)
+        .group_by(Repository.name, BuildPhase.phase)
+        .order_by(Repository.name, BuildPhase.phase)
+    )
+    if repository_name:
+        stmt = stmt.where(Repository.name == repository_name)
+    result = db.execute(stmt)
+    return list(result.all())
+
+def find_build_result(db: Session, repository_id: int, fingerprint: str) -> Optional[BuildResult]:
+    stmt = select(BuildResult).where(BuildResult.repository_id == repository_id, BuildResult.fingerprint == fingerprint)
+    result = db.execute(stmt)
+    return result.scalar_one_or_none()
+
+def save_build_result(
+    db: Session,
+    repository_id: int,
+    fingerprint: str,
+    build_id: int,
+    log_key: str,
+    artifacts_key: Optional[str] = None
+) -> None:
+    if find_build_result(db, repository_id, fingerprint):
+        return
+    db.add(BuildResult(
+        repository_id=repository_id,
+        fingerprint=fingerprint,
+        build_id=build_id,
+        log_key=log_key,
+        artifacts_key=artifacts_key,
+        created_at=datetime.now().replace(microsecond=0)
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+
+def purge_build_results(db: Session, repository_name: Optional[str] = None) -> int:
+    stmt = delete(BuildResult)
+    if repository_name:
+        stmt = stmt.where(BuildResult.repository_id.in_(select(Repository.id).where(Repository.name == repository_name)))
+    result = db.execute(stmt)
+    db.commit()
+    return result.rowcount
+
+def get_expired_build_ids(
+    db: Session,
+    repository_id: int,
+    keep_builds: Optional[int],
+    keep_days: Optional[int],
+    keep_latest_success: bool,
+    limit: int,
+    after_id: int = 0
+) -> List[int]:
+    if keep_builds is None and keep_days is None:
+        return []
+
+    finished = [BuildStatus.success, BuildStatus.failed, BuildStatus.cancelled, BuildStatus.skipped]
+    stmt = select(Build.id).where(Build.repository_id == repository_id, Build.status.in_(finished), Build.id > after_id)
+    if keep_builds is not None:
+        newest = (
+            select(Build.id)
+            .where(Build.repository_id == repository_id)
+            .order_by(desc(Build.created_at), desc(Build.id))
+            .limit(keep_builds)
+        )
+        stmt = stmt.where(Build.id.not_in(newest))
+    if keep_days is not None:
+        stmt = stmt.where(Build.created_at < datetime.now() - timedelta(days=keep_days))
+    if keep_latest_success:
+        latest = (
+            select(func.max(Build.id))
+            .where(Build.repository_id == repository_id, Build.status == BuildStatus.success)
+            .group_by(Build.ref_name)
+        )
+        stmt = stmt.where(Build.id.not_in(latest))
+
+    result = db.execute(stmt.order_by(Build.id).limit(limit))
+    return list(result.scalars().all())
+
+def get_build_object_keys(db: Session, build_ids: List[int]) -> List[tuple]:
+    stmt = select(Build.id, Build.log_key, Build.artifacts_key).where(Build.id.in_(build_ids))
+    return list(db.execute(stmt).all())
+
+def get_shared_object_keys(db: Session, keys: List[str], build_ids: List[int]) -> set:
+    stmt = select(Build.log_key, Build.artifacts_key).where(
+        or_(Build.log_key.in_(keys), Build.artifacts_key.in_(keys)),
+        Build.id.not_in(build_ids)
+    )
+    return {key for row in db.execute(stmt).all() for key in row if key}
+
+def get_stored_object_keys(db: Session) -> set:
+    log_keys = db.execute(select(Build.log_key).distinct().where(Build.log_key.is_not(None))).scalars().all()
+    artifacts_keys = db.execute(select(Build.artifacts_key).distinct().where(Build.artifacts_key.is_not(None))).scalars().all()
+    return set(log_keys) | set(artifacts_keys)
+
+def delete_builds(db: Session, build_ids: List[int]) -> int:
+    db.execute(delete(BuildResult).where(BuildResult.build_id.in_(build_ids)))
+    db.execute(delete(Job).where(Job.build_id.in_(build_ids)))
+    db.execute(delete(BuildPhase).where(BuildPhase.build_id.in_(build_ids)))
+    result = db.execute(delete(Build).where(Build.id.in_(build_ids)))
+    db.commit()
+    return result.rowcount
+
+@contextmanager
+def advisory_lock(engine, key: int):
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+
+    with engine.connect() as connection:
+        acquired = connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": key}).scalar()
+        connection.commit()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                connection.commit()
+
 def get_build_status(db: Session, build_id: int) -> Optional[BuildStatus]:
 
     stmt = select(Build.status).where(Build.id == build_id)
@@ -0,0 +1,97 @@
+import time
+import threading
+import docker
+from concurrent.futures import Future
+
+class ImageResolver:
+    def __init__(self, config):
+        self.client = docker.from_env()
+        self.default_ttl = config.IMAGE_PULL_TTL
+        self.ttls = config.IMAGE_PULL_TTLS
+        self.prewarm_images = config.IMAGE_PREWARM
+        self.prewarm_interval = config.IMAGE_PREWARM_INTERVAL
+
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._checked_at = {}
+
+    def ensure(self, image_name):
+        with self._lock:
+            future = self._in_flight.get(image_name)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[image_name] = future
+
+        if not owner:
+            print(f"Waiting for in-flight pull of {image_name}")
+            return future.result()
+
+        try:
+            image = self._resolve(image_name)
+            future.set_result(image)
+            return image
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[image_name]
+
+    def start_prewarm(self):
+        if not self.prewarm_images:
+            return
+        thread = threading.Thread(target=self._prewarm_loop, name="swompi-image-prewarm", daemon=True)
+        thread.start()
+
+    def _prewarm_loop(self):
+        while True:
+            for image_name in self.prewarm_images:
+                try:
+                    self.ensure(image_name)
+                except Exception as e:
+                    print(f"ERROR while pre-warming image {image_name}: {e}")
+            time.sleep(self.prewarm_interval)
+
+    def _resolve(self, image_name):
+        local_image = self._local_image(image_name)
+        if local_image:
+            if "@sha256:" in image_name:
+                print(f"Image {image_name} is pinned by digest and present locally")
+                return local_image
+            if self._is_fresh(image_name):
+                print(f"Image {image_name} was checked recently, skipping pull")
+                return local_image
+            if self._registry_digest_matches(image_name, local_image):
+                print(f"Image {image_name} is up to date with the registry")
+                self._checked_at[image_name] = time.monotonic()
+                return local_image
+
+        print(f"Pulling Docker image {image_name}")
+        image = self.client.images.pull(image_name)
+        self._checked_at[image_name] = time.monotonic()
+        print(f"Image {image_name} pulled successfully")
+        return image
+
+    def _local_image(self, image_name):
+        try:
+            return self.client.images.get(image_name)
+        except docker.errors.ImageNotFound:
+            return None
+
+    def _is_fresh(self, image_name):
+        checked_at = self._checked_at.get(image_name)
+        if checked_at is None:
+            return False
+        ttl = self.ttls.get(image_name, self.default_ttl)
+        return time.monotonic() - checked_at < ttl
+
+    def _registry_digest_matches(self, image_name, local_image):
+        try:
+            remote_digest = self.client.images.get_registry_data(image_name).id
+        except docker.errors.APIError as e:
+            print(f"Registry lookup for {image_name} failed, using local image: {e}")
+            return True
+
+        local_digests = [digest.split("@", 1)[-1] for digest in local_image.attrs.get("RepoDigests", [])]
+        return remote_digest in local_digests
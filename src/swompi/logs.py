@@ -0,0 +1,96 @@
+import time
+import threading
+
+STDOUT_PREFIX = b"STDOUT: "
+STDERR_PREFIX = b"STDERR: "
+FINAL_FLUSH_ATTEMPTS = 5
+FINAL_FLUSH_BACKOFF = 0.5
+
+class BuildLogSink:
+    def __init__(self, file_storage, build_id, job_name, log_file_path, config):
+        self.file_storage = file_storage
+        self.build_id = build_id
+        self.job_name = job_name
+        self.segment_size = config.LOG_SEGMENT_SIZE
+        self.flush_interval = config.LOG_FLUSH_INTERVAL
+
+        self._file = open(log_file_path, "wb")
+        self._buffer = bytearray()
+        self._sequence = 0
+        self.upload_error = None
+        self._line_start = {STDOUT_PREFIX: True, STDERR_PREFIX: True}
+        self._lock = threading.Lock()
+        self._upload_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name=f"swompi-log-{build_id}-{job_name}", daemon=True)
+        self._flusher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write_stdout(self, chunk):
+        self._write(STDOUT_PREFIX, chunk)
+
+    def write_stderr(self, chunk):
+        self._write(STDERR_PREFIX, chunk)
+
+    def close(self):
+        self._closed.set()
+        self._wakeup.set()
+        self._flusher.join()
+        self._file.close()
+
+        delay = FINAL_FLUSH_BACKOFF
+        for attempt in range(FINAL_FLUSH_ATTEMPTS):
+            if attempt:
+                time.sleep(delay)
+                delay *= 2
+            error = self.flush()
+            if error is None:
+                return
+        self.upload_error = f"the last {len(self._buffer)} byte(s) of the live log of job {self.job_name} were not uploaded: {error}"
+        print(f"ERROR in build {self.build_id}: {self.upload_error}")
+
+    def flush(self):
+        with self._upload_lock:
+            with self._lock:
+                if not self._buffer:
+                    return None
+                segment = bytes(self._buffer)
+                self._buffer.clear()
+                sequence = self._sequence
+                self._sequence += 1
+
+            try:
+                self.file_storage.upload_log_segment(self.build_id, self.job_name, sequence, segment)
+            except Exception as e:
+                print(f"ERROR while uploading log segment {sequence} of build {self.build_id} job {self.job_name}: {e}")
+                with self._lock:
+                    self._buffer[0:0] = segment
+                    self._sequence = sequence
+                return e
+        return None
+
+    def _write(self, prefix, chunk):
+        formatted = chunk.replace(b"\n", b"\n" + prefix)
+        if self._line_start[prefix]:
+            formatted = prefix + formatted
+        self._line_start[prefix] = chunk.endswith(b"\n")
+        if self._line_start[prefix]:
+            formatted = formatted[:-len(prefix)]
+
+        self._file.write(formatted)
+        with self._lock:
+            self._buffer += formatted
+            if len(self._buffer) >= self.segment_size:
+                self._wakeup.set()
+
+    def _flush_loop(self):
+        while not self._closed.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
@@ -1,82 +1,154 @@
-from flask import Flask, request, abort
-from sqlalchemy.orm import scoped_session
-import subprocess
+from aiohttp import web
+from contextlib import suppress
+import asyncio
+import hashlib
+import hmac
+import json
 from swompi.session import engine, SessionLocal as db_session_factory
-from swompi.functions import get_repo_by_url, create_build, create_repo, initialize_database
+from swompi.functions import create_build, cancel_superseded_builds, initialize_database
 from swompi.storage import FileStorageRepository
 from swompi.executor import Executor
+from swompi.dispatcher import BuildDispatcher
+from swompi.registry import RepositoryRegistry
+from swompi.retention import GarbageCollector
 from swompi.config import AppConfig
-from swompi.functions import Base
-import threading
-import sys
-import os
-from bot import *
-import asyncio
+from swompi.filters import collect_changed_paths
+from swompi.metrics import instrument_engine, instrument_s3, register_queue_collector
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from swompi.bot import bot, dp
 
-app = Flask(__name__)
+MAX_LOG_CHUNK = 1024 * 1024
 
 config = AppConfig()
 file_storage_repo = FileStorageRepository(config)
-executor = Executor(db_session_factory, file_storage_repo, config)
-
-@app.route("/webhook", methods=["POST"])
-def webhook():
-    if request.method == "POST":
-        repo_url = request.json['repository']['clone_url']
-        commit_sha = request.json['after']
-        commit_message = request.json['head_commit']['message']
-        commit_author = request.json['head_commit']['author']['username']
-        ref_name = executor._parse_ref(request.json['ref'])
-
-        with db_session_factory() as db_session:
-            repository = get_repo_by_url(db_session, repo_url)
-            if repository:
-                new_build = create_build(db_session, repository.id, commit_sha, commit_message, commit_author, ref_name)
-                print(f"Build {new_build} has been queued")
-                
-                executor.run_build(build_id=new_build, request_json=request.json)
-
-                return "success", 200
-            else:
-                print(f"Repository {repo_url} not found. Cannot start build")
-                abort(403)
-    else:
-        abort(400)
-
-def run_bot_subprocess():
-    
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    bot_script = os.path.join(current_dir, "bot.py")
-    
+executor = Executor(db_session_factory, file_storage_repo, config) if config.EMBEDDED_RUNNER else None
+dispatcher = BuildDispatcher(db_session_factory, executor, config, engine) if executor else None
+registry = RepositoryRegistry(db_session_factory, engine, config)
+garbage_collector = GarbageCollector(db_session_factory, engine, file_storage_repo, config)
+
+routes = web.RouteTableDef()
+bot_polling = web.AppKey("bot_polling", asyncio.Task)
+
+@routes.post("/webhook")
+async def webhook(request):
+    body = await request.read()
+    if not verify_signature(body, request.headers.get("X-Hub-Signature-256")):
+        raise web.HTTPUnauthorized(text="Invalid signature")
+
+    event = request.headers.get("X-GitHub-Event", "push")
+    if event == "ping":
+        return web.Response(text="pong")
+    if event != "push":
+        return web.Response(text="ignored", status=202)
+
+    try:
+        payload = json.loads(body)
+        repo_url = payload['repository']['clone_url']
+        commit_sha = payload['after']
+        ref_name = parse_ref(payload['ref'])
+        head_commit = payload['head_commit']
+        if head_commit is None or ref_name is None:
+            return web.Response(text="ignored", status=202)
+        commit_message = head_commit['message']
+        author = head_commit['author'].get('username') or head_commit['author'].get('name', "")
+        before_sha = payload.get('before')
+        changed_paths = collect_changed_paths(payload.get('commits'))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise web.HTTPBadRequest(text="Malformed push payload")
+
+    repository_id = await asyncio.to_thread(registry.lookup, repo_url)
+    if repository_id is None:
+        print(f"Repository {repo_url} not found. Cannot start build")
+        raise web.HTTPForbidden()
+
+    await asyncio.to_thread(queue_build, repository_id, commit_sha, commit_message, author, ref_name, before_sha, changed_paths)
+    if dispatcher:
+        dispatcher.notify()
+    return web.Response(text="queued", status=202)
+
+@routes.get(r"/builds/{build_id:\d+}/log")
+async def build_log(request):
+    build_id = int(request.match_info["build_id"])
+    offset = int_param(request, "offset", 0)
+    limit = min(int_param(request, "limit", 65536), MAX_LOG_CHUNK)
+    job_name = request.query.get("job")
+    if not job_name:
+        jobs = await asyncio.to_thread(file_storage_repo.list_log_jobs, build_id)
+        job_name = next(iter(jobs), None)
+    if job_name is None:
+        raise web.HTTPNotFound()
+
+    data, next_offset = await asyncio.to_thread(file_storage_repo.read_log, build_id, job_name, offset, limit)
+    return web.Response(
+        body=data,
+        content_type="text/plain",
+        charset="utf-8",
+        headers={"X-Next-Offset": str(next_offset), "X-Job-Name": job_name}
+    )
+
+@routes.get("/metrics")
+async def metrics(request):
+    body = await asyncio.to_thread(generate_latest)
+    return web.Response(body=body, headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+def parse_ref(ref_string):
+    parts = ref_string.split('/')
+    if len(parts) < 3 or parts[0] != 'refs':
+        return None
+    return '/'.join(parts[2:])
+
+def verify_signature(body, signature):
+    if not config.WEBHOOK_SECRET:
+        return True
+    expected = "sha256=" + hmac.new(config.WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return signature is not None and hmac.compare_digest(expected, signature)
+
+def int_param(request, name, default):
     try:
-        process = subprocess.Popen(
-            [sys.executable, bot_script],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
-        )
-
-        def read_output():
-            while True:
-                line = process.stdout.readline()
-                if line:
-                    print(f"[BOT] {line.strip()}")
-                if process.poll() is not None:
-                    break
-    
-        output_thread = threading.Thread(target=read_output, daemon=True)
-        output_thread.start()
-        process.wait()
-        
-    except Exception as e:
-        print(f"Error: {e}")
+        return int(request.query[name])
+    except (KeyError, ValueError):
+        return default
+
+def queue_build(repository_id, commit_sha, commit_message, commit_author, ref_name, before_sha=None, changed_paths=None):
+    with db_session_factory() as db_session:
+        new_build = create_build(db_session, repository_id, commit_sha, commit_message, commit_author, ref_name, before_sha, changed_paths)
+        print(f"Build {new_build} has been queued")
+        if config.COALESCE_PENDING_BUILDS:
+            superseded = cancel_superseded_builds(db_session, new_build, config.CANCEL_SUPERSEDED_BUILDS)
+            if superseded:
+                print(f"Build(s) {', '.join(map(str, superseded))} on {ref_name} superseded by build {new_build}")
+    return new_build
+
+async def start_bot(app):
+    app[bot_polling] = asyncio.create_task(dp.start_polling(bot, handle_signals=False))
+
+async def stop_bot(app):
+    app[bot_polling].cancel()
+    with suppress(asyncio.CancelledError):
+        await app[bot_polling]
+
+def create_app(with_bot=True):
+    app = web.Application()
+    app.add_routes(routes)
+    if with_bot:
+        app.on_startup.append(start_bot)
+        app.on_cleanup.append(stop_bot)
+    return app
 
 if __name__ == "__main__":
+    if not config.WEBHOOK_SECRET:
+        print("WARNING: WEBHOOK_SECRET is not set, webhook signatures are not checked")
     initialize_database()
-    
-    bot_thread = threading.Thread(target=run_bot_subprocess, daemon=True)
-    bot_thread.start()
-    
-    app.run(host="0.0.0.0", port=25851, debug=False, use_reloader=False)
\ No newline at end of file
+    instrument_engine(engine)
+    instrument_s3(file_storage_repo.s3_client)
+    register_queue_collector(db_session_factory)
+    registry.start()
+    garbage_collector.start()
+    if executor:
+        executor.image_resolver.start_prewarm()
+        executor.workspaces.start()
+        executor.container_pool.start()
+        executor.notifications.start()
+        dispatcher.start()
+
+    web.run_app(create_app(), host="0.0.0.0", port=25851, access_log=None)
@@ -0,0 +1,94 @@
+import time
+from contextlib import contextmanager, nullcontext
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from swompi.functions import add_build_phases, count_builds_by_status
+from swompi.models import BuildStatus
+
+PHASES = ("queue_wait", "clone", "config", "pull", "run", "archive", "upload", "notify")
+PHASE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+BUILD_PHASE_SECONDS = Histogram(
+    "swompi_build_phase_seconds", "Duration of build phases", ["phase"], buckets=PHASE_BUCKETS
+)
+BUILDS_FINISHED = Counter("swompi_builds_finished_total", "Builds finished by this process", ["status"])
+ACTIVE_BUILDS = Gauge("swompi_builds_active", "Builds currently executed by this process")
+LOG_UPLOAD_FAILURES = Counter("swompi_log_upload_failures_total", "Jobs whose live log could not be uploaded completely")
+S3_REQUEST_SECONDS = Histogram(
+    "swompi_s3_request_seconds", "Latency of S3 API calls", ["operation"], buckets=LATENCY_BUCKETS
+)
+DB_QUERY_SECONDS = Histogram("swompi_db_query_seconds", "Latency of database statements", buckets=LATENCY_BUCKETS)
+
+class PhaseTimer:
+    def __init__(self, build_id):
+        self.build_id = build_id
+        self.records = []
+
+    @contextmanager
+    def phase(self, name, job_name=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started, job_name)
+
+    def record(self, name, seconds, job_name=None):
+        self.records.append({"phase": name, "job_name": job_name, "duration_ms": int(seconds * 1000)})
+        BUILD_PHASE_SECONDS.labels(name).observe(seconds)
+
+    def save(self, db_session_factory):
+        if not self.records:
+            return
+        with db_session_factory() as db_session:
+            add_build_phases(db_session, self.build_id, self.records)
+
+def phase(timer, name, job_name=None):
+    return timer.phase(name, job_name) if timer else nullcontext()
+
+class QueueCollector:
+    def __init__(self, db_session_factory):
+        self.db_session_factory = db_session_factory
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        try:
+            with self.db_session_factory() as db_session:
+                counts = count_builds_by_status(db_session, [BuildStatus.pending, BuildStatus.running])
+        except Exception as e:
+            print(f"ERROR while collecting queue metrics: {e}")
+            return
+        yield GaugeMetricFamily("swompi_builds_queued", "Builds waiting for a runner", value=counts.get(BuildStatus.pending, 0))
+        yield GaugeMetricFamily("swompi_builds_running", "Builds running on any runner", value=counts.get(BuildStatus.running, 0))
+
+def instrument_s3(s3_client):
+    def before_call(params, context, model, **kwargs):
+        context["swompi_started"] = time.perf_counter()
+
+    def after_call(context, model, **kwargs):
+        started = context.get("swompi_started")
+        if started is not None:
+            S3_REQUEST_SECONDS.labels(model.name).observe(time.perf_counter() - started)
+
+    s3_client.meta.events.register("before-call.s3", before_call)
+    s3_client.meta.events.register("after-call.s3", after_call)
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("swompi_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_SECONDS.observe(time.perf_counter() - conn.info["swompi_started"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("swompi_started"):
+            context.connection.info["swompi_started"].pop()
+
+def register_queue_collector(db_session_factory):
+    REGISTRY.register(QueueCollector(db_session_factory))
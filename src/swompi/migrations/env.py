@@ -0,0 +1,22 @@
+from alembic import context
+from swompi.models import Base
+from swompi.session import engine
+
+target_metadata = Base.metadata
+
+def run_migrations_offline():
+    context.configure(url=engine.url, target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    connectable = context.config.attributes.get("engine", engine)
+    with connectable.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
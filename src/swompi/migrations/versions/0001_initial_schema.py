@@ -0,0 +1,56 @@
+"""Initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+build_status = sa.Enum("pending", "running", "success", "failed", name="buildstatus")
+
+def upgrade():
+    op.create_table(
+        "repositories",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("url", sa.String(100), nullable=False, unique=True),
+        sa.Column("name", sa.String(100), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False)
+    )
+    op.create_index("ix_repositories_id", "repositories", ["id"])
+
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_name", sa.String(100), nullable=False, unique=True),
+        sa.Column("chat_id", sa.String(), nullable=True)
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+
+    op.create_table(
+        "builds",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("repository_id", sa.Integer(), sa.ForeignKey("repositories.id"), nullable=False),
+        sa.Column("commit_sha", sa.String(40), nullable=False),
+        sa.Column("commit_message", sa.Text(), nullable=False),
+        sa.Column("commit_author", sa.String(100), nullable=False),
+        sa.Column("ref_name", sa.String(100), nullable=False),
+        sa.Column("status", build_status, nullable=False),
+        sa.Column("log_key", sa.String(255), nullable=True),
+        sa.Column("artifacts_key", sa.String(255), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True)
+    )
+    op.create_index("ix_builds_id", "builds", ["id"])
+
+def downgrade():
+    op.drop_table("builds")
+    op.drop_table("users")
+    op.drop_table("repositories")
+    build_status.drop(op.get_bind(), checkfirst=True)
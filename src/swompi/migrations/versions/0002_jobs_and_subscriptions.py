@@ -0,0 +1,74 @@
+"""Clone modes, pipeline jobs, subscriptions and new build statuses
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+NEW_STATUSES = ("skipped", "cancelled")
+build_status = sa.Enum("pending", "running", "success", "failed", *NEW_STATUSES, name="buildstatus").with_variant(
+    postgresql.ENUM(name="buildstatus", create_type=False), "postgresql"
+)
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if bind.dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            for status in NEW_STATUSES:
+                op.execute(f"ALTER TYPE buildstatus ADD VALUE IF NOT EXISTS '{status}'")
+
+    repository_columns = {column["name"] for column in inspector.get_columns("repositories")}
+    if "clone_mode" not in repository_columns:
+        op.add_column("repositories", sa.Column("clone_mode", sa.String(16), nullable=False, server_default="full"))
+    if "clone_depth" not in repository_columns:
+        op.add_column("repositories", sa.Column("clone_depth", sa.Integer(), nullable=True))
+
+    tables = inspector.get_table_names()
+    if "jobs" not in tables:
+        op.create_table(
+            "jobs",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("build_id", sa.Integer(), sa.ForeignKey("builds.id"), nullable=False),
+            sa.Column("name", sa.String(100), nullable=False),
+            sa.Column("stage", sa.String(100), nullable=False),
+            sa.Column("image", sa.String(255), nullable=False),
+            sa.Column("status", build_status, nullable=False),
+            sa.Column("exit_code", sa.Integer(), nullable=True),
+            sa.Column("started_at", sa.DateTime(), nullable=True),
+            sa.Column("finished_at", sa.DateTime(), nullable=True)
+        )
+        op.create_index("ix_jobs_id", "jobs", ["id"])
+        op.create_index("ix_jobs_build_id", "jobs", ["build_id"])
+
+    if "subscriptions" not in tables:
+        op.create_table(
+            "subscriptions",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("repository_id", sa.Integer(), sa.ForeignKey("repositories.id"), nullable=False),
+            sa.Column("ref_name", sa.String(100), nullable=True),
+            sa.Column("failures_only", sa.Boolean(), nullable=False, server_default=sa.false()),
+            sa.UniqueConstraint("user_id", "repository_id", "ref_name", name="uq_subscriptions_user_repository_ref")
+        )
+        op.create_index("ix_subscriptions_id", "subscriptions", ["id"])
+        op.create_index("ix_subscriptions_repository_ref", "subscriptions", ["repository_id", "ref_name"])
+
+    if "ix_users_chat_id" not in {index["name"] for index in inspector.get_indexes("users")}:
+        op.create_index("ix_users_chat_id", "users", ["chat_id"])
+
+def downgrade():
+    op.drop_index("ix_users_chat_id", table_name="users")
+    op.drop_table("subscriptions")
+    op.drop_table("jobs")
+    op.drop_column("repositories", "clone_depth")
+    op.drop_column("repositories", "clone_mode")
@@ -0,0 +1,29 @@
+"""Indexes for build history, the build queue and repository lookups
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index("ix_repositories_name", "repositories", ["name"])
+    op.create_index(
+        "ix_builds_repository_created",
+        "builds",
+        ["repository_id", sa.text("created_at DESC"), sa.text("id DESC")]
+    )
+    op.create_index("ix_builds_status_created", "builds", ["status", "created_at", "id"])
+    op.create_index("ix_builds_repository_ref_status", "builds", ["repository_id", "ref_name", "status"])
+
+def downgrade():
+    op.drop_index("ix_builds_repository_ref_status", table_name="builds")
+    op.drop_index("ix_builds_status_created", table_name="builds")
+    op.drop_index("ix_builds_repository_created", table_name="builds")
+    op.drop_index("ix_repositories_name", table_name="repositories")
@@ -0,0 +1,23 @@
+"""Runner claims, heartbeats and label requirements of builds
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("builds", sa.Column("runner_id", sa.String(100), nullable=True))
+    op.add_column("builds", sa.Column("heartbeat_at", sa.DateTime(), nullable=True))
+    op.add_column("builds", sa.Column("required_labels", sa.String(255), nullable=True))
+
+def downgrade():
+    op.drop_column("builds", "required_labels")
+    op.drop_column("builds", "heartbeat_at")
+    op.drop_column("builds", "runner_id")
@@ -0,0 +1,28 @@
+"""Phase timings of builds
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "build_phases",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("build_id", sa.Integer(), sa.ForeignKey("builds.id"), nullable=False),
+        sa.Column("job_name", sa.String(100), nullable=True),
+        sa.Column("phase", sa.String(32), nullable=False),
+        sa.Column("duration_ms", sa.Integer(), nullable=False)
+    )
+    op.create_index("ix_build_phases_id", "build_phases", ["id"])
+    op.create_index("ix_build_phases_build_id", "build_phases", ["build_id"])
+
+def downgrade():
+    op.drop_table("build_phases")
@@ -0,0 +1,21 @@
+"""Push range of builds for path filters
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("builds", sa.Column("before_sha", sa.String(40), nullable=True))
+    op.add_column("builds", sa.Column("changed_paths", sa.Text(), nullable=True))
+
+def downgrade():
+    op.drop_column("builds", "changed_paths")
+    op.drop_column("builds", "before_sha")
@@ -0,0 +1,35 @@
+"""Result cache of identical builds
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("repositories", sa.Column("result_cache", sa.Boolean(), nullable=False, server_default=sa.true()))
+    op.add_column("builds", sa.Column("cached_from", sa.Integer(), nullable=True))
+    op.create_table(
+        "build_results",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("repository_id", sa.Integer(), sa.ForeignKey("repositories.id"), nullable=False),
+        sa.Column("fingerprint", sa.String(64), nullable=False),
+        sa.Column("build_id", sa.Integer(), sa.ForeignKey("builds.id"), nullable=False),
+        sa.Column("log_key", sa.String(255), nullable=False),
+        sa.Column("artifacts_key", sa.String(255), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.UniqueConstraint("repository_id", "fingerprint", name="uq_build_results_repository_fingerprint")
+    )
+    op.create_index("ix_build_results_id", "build_results", ["id"])
+    op.create_index("ix_build_results_build_id", "build_results", ["build_id"])
+
+def downgrade():
+    op.drop_table("build_results")
+    op.drop_column("builds", "cached_from")
+    op.drop_column("repositories", "result_cache")
@@ -0,0 +1,19 @@
+"""Workspace backend of repositories
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("repositories", sa.Column("workspace_backend", sa.String(16), nullable=True))
+
+def downgrade():
+    op.drop_column("repositories", "workspace_backend")
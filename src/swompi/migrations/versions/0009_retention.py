@@ -0,0 +1,23 @@
+"""Retention policy of repositories
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("repositories", sa.Column("keep_builds", sa.Integer(), nullable=True))
+    op.add_column("repositories", sa.Column("keep_days", sa.Integer(), nullable=True))
+    op.add_column("repositories", sa.Column("keep_latest_success", sa.Boolean(), nullable=True))
+
+def downgrade():
+    op.drop_column("repositories", "keep_latest_success")
+    op.drop_column("repositories", "keep_days")
+    op.drop_column("repositories", "keep_builds")
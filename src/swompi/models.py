@@ -1,5 +1,5 @@
 from sqlalchemy.orm import relationship
-from sqlalchemy import Integer, String, ForeignKey, Enum, Text, DateTime
+from sqlalchemy import Integer, String, ForeignKey, Enum, Text, DateTime, Boolean, Index, UniqueConstraint, text
 from sqlalchemy.orm import declarative_base, Mapped, mapped_column, relationship
 from typing import Optional
 import enum
@@ -11,6 +11,8 @@ class BuildStatus(enum.Enum):
     running = 'running'
     success = 'success'
     failed = 'failed'
+    skipped = 'skipped'
+    cancelled = 'cancelled'
 
 Base = declarative_base()
 
@@ -18,10 +20,19 @@ class Repository(Base):
     __tablename__ = 'repositories'
     id: Mapped[int] =  mapped_column(Integer, primary_key=True, index=True)
     url: Mapped[str] = mapped_column(String(100), unique=True, nullable=False)
-    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    name: Mapped[str] = mapped_column(String(100), nullable=False, index=True)
     created_at: Mapped [DateTime] = mapped_column(DateTime, nullable=False)
+    clone_mode: Mapped[str] = mapped_column(String(16), nullable=False, default="full")
+    clone_depth: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    result_cache: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+    workspace_backend: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)
+    keep_builds: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    keep_days: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    keep_latest_success: Mapped[Optional[bool]] = mapped_column(Boolean, nullable=True)
     
     builds = relationship("Build", back_populates="repository", cascade="all, delete-orphan")
+    subscriptions = relationship("Subscription", back_populates="repository", cascade="all, delete-orphan")
+    build_results = relationship("BuildResult", back_populates="repository", cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<Repository(id={self.id}, name='{self.name}')>"
@@ -30,13 +41,20 @@ class User(Base):
     __tablename__ = 'users'
     id: Mapped[int] =  mapped_column(Integer, primary_key=True, index=True)
     user_name: Mapped[int] = mapped_column(String(100), unique=True, nullable=False)
-    chat_id: Mapped[Optional[int]] = mapped_column(String, nullable=True)
+    chat_id: Mapped[Optional[int]] = mapped_column(String, nullable=True, index=True)
+
+    subscriptions = relationship("Subscription", back_populates="user", cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<User(id={self.id}, user_name='{self.user_name}')>"
 
 class Build(Base):
     __tablename__ = 'builds'
+    __table_args__ = (
+        Index('ix_builds_repository_created', 'repository_id', text('created_at DESC'), text('id DESC')),
+        Index('ix_builds_status_created', 'status', 'created_at', 'id'),
+        Index('ix_builds_repository_ref_status', 'repository_id', 'ref_name', 'status'),
+    )
     
     id: Mapped[int] =  mapped_column(Integer, primary_key=True, index=True)
     repository_id: Mapped[int] = mapped_column(Integer, ForeignKey('repositories.id'), nullable=False)
@@ -44,6 +62,8 @@ class Build(Base):
     commit_message: Mapped[Text] = mapped_column(Text, nullable=False)
     commit_author: Mapped[str] = mapped_column(String(100), nullable=False)
     ref_name: Mapped[str] = mapped_column(String(100), nullable=False)
+    before_sha: Mapped[Optional[str]] = mapped_column(String(40), nullable=True)
+    changed_paths: Mapped[Optional[Text]] = mapped_column(Text, nullable=True)
     
     status: Mapped[BuildStatus] = mapped_column(Enum(BuildStatus), default=BuildStatus.pending)
     
@@ -53,9 +73,89 @@ class Build(Base):
     created_at: Mapped [Optional[DateTime]] = mapped_column(DateTime, nullable=False)
     started_at: Mapped [Optional[DateTime]] = mapped_column(DateTime, nullable=True)
     finished_at: Mapped [Optional[DateTime]] = mapped_column(DateTime, nullable=True)
+
+    runner_id: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    heartbeat_at: Mapped [Optional[DateTime]] = mapped_column(DateTime, nullable=True)
+    required_labels: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    cached_from: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     
     repository = relationship("Repository", back_populates="builds")
+    jobs = relationship("Job", back_populates="build", cascade="all, delete-orphan")
+    phases = relationship("BuildPhase", back_populates="build", cascade="all, delete-orphan")
+    results = relationship("BuildResult", back_populates="build", cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<Build(id={self.id}, sha='{self.commit_sha}', status='{self.status.name}')>"
 
+class Job(Base):
+    __tablename__ = 'jobs'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    build_id: Mapped[int] = mapped_column(Integer, ForeignKey('builds.id'), nullable=False, index=True)
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    stage: Mapped[str] = mapped_column(String(100), nullable=False)
+    image: Mapped[str] = mapped_column(String(255), nullable=False)
+    status: Mapped[BuildStatus] = mapped_column(Enum(BuildStatus), default=BuildStatus.pending)
+    exit_code: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
+    started_at: Mapped [Optional[DateTime]] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped [Optional[DateTime]] = mapped_column(DateTime, nullable=True)
+
+    build = relationship("Build", back_populates="jobs")
+
+    def __repr__(self):
+        return f"<Job(id={self.id}, name='{self.name}', status='{self.status.name}')>"
+
+class Subscription(Base):
+    __tablename__ = 'subscriptions'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'repository_id', 'ref_name', name='uq_subscriptions_user_repository_ref'),
+        Index('ix_subscriptions_repository_ref', 'repository_id', 'ref_name'),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=False)
+    repository_id: Mapped[int] = mapped_column(Integer, ForeignKey('repositories.id'), nullable=False)
+    ref_name: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    failures_only: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+
+    user = relationship("User", back_populates="subscriptions")
+    repository = relationship("Repository", back_populates="subscriptions")
+
+    def __repr__(self):
+        return f"<Subscription(user_id={self.user_id}, repository_id={self.repository_id}, ref='{self.ref_name}')>"
+
+class BuildPhase(Base):
+    __tablename__ = 'build_phases'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    build_id: Mapped[int] = mapped_column(Integer, ForeignKey('builds.id'), nullable=False, index=True)
+    job_name: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    phase: Mapped[str] = mapped_column(String(32), nullable=False)
+    duration_ms: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    build = relationship("Build", back_populates="phases")
+
+    def __repr__(self):
+        return f"<BuildPhase(build_id={self.build_id}, phase='{self.phase}', duration_ms={self.duration_ms})>"
+
+class BuildResult(Base):
+    __tablename__ = 'build_results'
+    __table_args__ = (
+        UniqueConstraint('repository_id', 'fingerprint', name='uq_build_results_repository_fingerprint'),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    repository_id: Mapped[int] = mapped_column(Integer, ForeignKey('repositories.id'), nullable=False)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    build_id: Mapped[int] = mapped_column(Integer, ForeignKey('builds.id'), nullable=False, index=True)
+    log_key: Mapped[str] = mapped_column(String(255), nullable=False)
+    artifacts_key: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    created_at: Mapped [DateTime] = mapped_column(DateTime, nullable=False)
+
+    repository = relationship("Repository", back_populates="build_results")
+    build = relationship("Build", back_populates="results")
+
+    def __repr__(self):
+        return f"<BuildResult(repository_id={self.repository_id}, fingerprint='{self.fingerprint}', build_id={self.build_id})>"
+
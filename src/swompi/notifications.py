@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from swompi.functions import get_builds, get_subscribed_chats, add_build_phases
+from swompi.metrics import BUILD_PHASE_SECONDS
+
+MESSAGE_LIMIT = 4096
+
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class NotificationDispatcher:
+    def __init__(self, db_session_factory, config):
+        self.db_session_factory = db_session_factory
+        self.token = config.TELEGRAM_BOT_TOKEN
+        self.api_url = config.TELEGRAM_API_URL
+        self.batch_window = config.NOTIFY_BATCH_WINDOW
+        self.global_rate = config.NOTIFY_GLOBAL_RATE
+        self.chat_rate = config.NOTIFY_CHAT_RATE
+        self.max_retries = config.NOTIFY_MAX_RETRIES
+
+        self._loop = None
+        self._queue = None
+        self._ready = threading.Event()
+
+    def start(self):
+        thread = threading.Thread(target=self._run_loop, name="swompi-notifications", daemon=True)
+        thread.start()
+        self._ready.wait()
+        print("Notification dispatcher started")
+
+    def enqueue(self, build_id):
+        if self._loop is None:
+            print(f"Notification dispatcher is not running, build {build_id} is not announced")
+            return
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (build_id, time.monotonic()))
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._ready.set()
+        self._loop.run_until_complete(self._consume())
+
+    async def _consume(self):
+        bot = Bot(token=self.token, session=telegram_session(self.api_url))
+        global_limiter = RateLimiter(self.global_rate)
+        chat_limiters = {}
+        sending = set()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.batch_window
+            while (remaining := deadline - self._loop.time()) > 0:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            build_ids = [build_id for build_id, _ in batch]
+            try:
+                messages = await asyncio.to_thread(self._compose, build_ids)
+            except Exception as e:
+                print(f"ERROR while preparing notifications for build(s) {build_ids}: {e}")
+                continue
+
+            deliveries = []
+            for chat_id, text in messages.items():
+                chat_limiter = chat_limiters.setdefault(chat_id, RateLimiter(self.chat_rate))
+                deliveries.append(self._deliver(bot, chat_id, text, global_limiter, chat_limiter))
+            task = asyncio.create_task(self._deliver_batch(batch, deliveries))
+            sending.add(task)
+            task.add_done_callback(sending.discard)
+
+    async def _deliver_batch(self, batch, deliveries):
+        await asyncio.gather(*deliveries)
+        delivered_at = time.monotonic()
+        try:
+            await asyncio.to_thread(self._record_notify_phase, batch, delivered_at)
+        except Exception as e:
+            print(f"ERROR while saving notification timings: {e}")
+
+    def _record_notify_phase(self, batch, delivered_at):
+        with self.db_session_factory() as db_session:
+            for build_id, enqueued_at in batch:
+                seconds = delivered_at - enqueued_at
+                BUILD_PHASE_SECONDS.labels("notify").observe(seconds)
+                add_build_phases(db_session, build_id, [{"phase": "notify", "job_name": None, "duration_ms": int(seconds * 1000)}])
+
+    def _compose(self, build_ids):
+        lines_by_chat = {}
+        with self.db_session_factory() as db_session:
+            for build in get_builds(db_session, build_ids):
+                line = f"Build {build.id} of {build.repository.name} ({build.ref_name}) finished with status: {build.status.value}"
+                if build.cached_from:
+                    line += f" (result of build {build.cached_from} reused)"
+                for chat_id in get_subscribed_chats(db_session, build.repository_id, build.ref_name, build.status):
+                    lines_by_chat.setdefault(chat_id, []).append(line)
+        return {chat_id: "\n".join(lines) for chat_id, lines in lines_by_chat.items()}
+
+    async def _deliver(self, bot, chat_id, text, global_limiter, chat_limiter):
+        for chunk in _split_message(text):
+            if not await self._send(bot, chat_id, chunk, global_limiter, chat_limiter):
+                return
+
+    async def _send(self, bot, chat_id, text, global_limiter, chat_limiter):
+        for attempt in range(self.max_retries + 1):
+            await chat_limiter.wait()
+            await global_limiter.wait()
+            try:
+                await bot.send_message(str(chat_id), text)
+                return True
+            except TelegramRetryAfter as e:
+                print(f"Telegram asked to retry chat {chat_id} after {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                print(f"Notification to chat {chat_id} rejected: {e}")
+                return False
+            except Exception as e:
+                print(f"ERROR while notifying chat {chat_id} (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(2 ** attempt)
+        print(f"Notification to chat {chat_id} dropped after {self.max_retries} retries")
+        return False
+
+def telegram_session(api_url):
+    if not api_url:
+        return None
+    return AiohttpSession(api=TelegramAPIServer.from_base(api_url))
+
+def _split_message(text):
+    chunks = []
+    current = ""
+    for line in text.split("\n"):
+        line = line[:MESSAGE_LIMIT]
+        if current and len(current) + 1 + len(line) > MESSAGE_LIMIT:
+            chunks.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
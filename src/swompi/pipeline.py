@@ -0,0 +1,198 @@
+import re
+import copy
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import yaml
+from schema import Schema, Optional, SchemaError, And, Or
+from swompi.models import BuildStatus
+
+CONFIG_FILENAME = ".swompi.yml"
+DEFAULT_JOB_NAME = "build"
+DEFAULT_STAGE = "build"
+JOB_KEYS = ("image", "variables", "before_script", "scripts", "after_script", "artifacts", "cache", "resources", "tags")
+
+non_empty_list_of_strings = And([str], lambda l: len(l) > 0, error='This list cannot be empty')
+
+valid_image_name = And(str, lambda s: not re.search(r'\s', s), error='Image name cannot contain whitespace')
+
+resources_schema = {
+    Optional("cpus"): And(Or(int, float), lambda v: v > 0, error='cpus must be a positive number'),
+    Optional("memory"): Or(
+        And(int, lambda v: v > 0),
+        And(str, lambda s: re.match(r'^\d+(\.\d+)?\s*[kmgKMG]?[bB]?$', s.strip()) is not None),
+        error='memory must be a size like 512m or 2g'
+    ),
+    Optional("pids"): And(int, lambda v: v > 0, error='pids must be a positive integer')
+}
+
+filter_schema = {
+    Optional("refs"): non_empty_list_of_strings,
+    Optional("changes"): non_empty_list_of_strings
+}
+
+job_schema = {
+    Optional("variables"): {str: Or(int, str)},
+    Optional("resources"): resources_schema,
+    Optional("tags"): [str],
+    Optional("before_script"): [str],
+    "scripts": non_empty_list_of_strings,
+    Optional("after_script"): [str],
+    Optional("artifacts"): {
+        "paths": non_empty_list_of_strings
+    },
+    Optional("cache"): {
+        Optional("key"): Or(str, {"files": non_empty_list_of_strings}),
+        "paths": non_empty_list_of_strings
+    }
+}
+
+CONFIG_SCHEMA = Schema(Or(
+    {"image": valid_image_name, Optional("only"): filter_schema, Optional("except"): filter_schema, **job_schema},
+    {
+        Optional("image"): valid_image_name,
+        Optional("only"): filter_schema,
+        Optional("except"): filter_schema,
+        Optional("variables"): {str: Or(int, str)},
+        Optional("resources"): resources_schema,
+        Optional("tags"): [str],
+        Optional("stages"): non_empty_list_of_strings,
+        "jobs": And({str: {
+            Optional("image"): valid_image_name,
+            Optional("stage"): str,
+            Optional("needs"): [str],
+            **job_schema
+        }}, lambda jobs: len(jobs) > 0, error='At least one job is required')
+    }
+))
+
+def parse_config(raw_config):
+    try:
+        configuration = yaml.safe_load(raw_config)
+    except yaml.YAMLError as e:
+        raise Exception(f"YAML syntax error: {e}")
+    if not isinstance(configuration, dict):
+        raise Exception(f"Configuration error: {CONFIG_FILENAME} is empty or invalid")
+
+    try:
+        CONFIG_SCHEMA.validate(configuration)
+    except SchemaError as e:
+        raise Exception(f"Configuration error: {e}")
+    return configuration
+
+class PipelineConfigCache:
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def load(self, blob_sha, read_blob):
+        with self._lock:
+            entry = self._entries.get(blob_sha)
+            if entry is not None:
+                self._entries.move_to_end(blob_sha)
+
+        if entry is None:
+            raw_config = read_blob()
+            try:
+                entry = (parse_config(raw_config), None)
+            except Exception as e:
+                entry = (None, str(e))
+            with self._lock:
+                self._entries[blob_sha] = entry
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+
+        configuration, error = entry
+        if error:
+            raise Exception(error)
+        return copy.deepcopy(configuration)
+
+def plan_jobs(config_data):
+    if "jobs" not in config_data:
+        job = {key: config_data[key] for key in JOB_KEYS if key in config_data}
+        job.update(name=DEFAULT_JOB_NAME, stage=DEFAULT_STAGE, needs=[])
+        job.setdefault("tags", [])
+        return [job]
+
+    stages = config_data.get("stages") or [DEFAULT_STAGE]
+    jobs = []
+    for name, job_config in config_data["jobs"].items():
+        job = dict(job_config, name=name)
+        job.setdefault("stage", stages[0])
+        job.setdefault("image", config_data.get("image"))
+        job["variables"] = config_data.get("variables", {}) | job_config.get("variables", {})
+        job["resources"] = config_data.get("resources", {}) | job_config.get("resources", {})
+        job["tags"] = sorted(set(config_data.get("tags", [])) | set(job_config.get("tags", [])))
+        if not job["image"]:
+            raise Exception(f"Configuration error: job '{name}' has no image")
+        if job["stage"] not in stages:
+            raise Exception(f"Configuration error: job '{name}' uses unknown stage '{job['stage']}'")
+        jobs.append(job)
+
+    names = {job["name"] for job in jobs}
+    for job in jobs:
+        if "needs" in job:
+            unknown = set(job["needs"]) - names
+            if unknown:
+                raise Exception(f"Configuration error: job '{job['name']}' needs unknown job(s) {', '.join(sorted(unknown))}")
+        else:
+            stage_index = stages.index(job["stage"])
+            job["needs"] = [other["name"] for other in jobs if stages.index(other["stage"]) < stage_index]
+
+    return _topological_order(jobs)
+
+def run_pipeline(jobs, run_job, max_parallel, cancelled=None):
+    statuses = {job["name"]: BuildStatus.pending for job in jobs}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="swompi-job") as pool:
+        while True:
+            for job in jobs:
+                if statuses[job["name"]] != BuildStatus.pending:
+                    continue
+                needs = [statuses[name] for name in job["needs"]]
+                if cancelled is not None and cancelled.is_set():
+                    statuses[job["name"]] = BuildStatus.cancelled
+                elif any(status in (BuildStatus.failed, BuildStatus.skipped, BuildStatus.cancelled) for status in needs):
+                    print(f"Skipping job {job['name']}: a job it needs did not succeed")
+                    statuses[job["name"]] = BuildStatus.skipped
+                elif all(status == BuildStatus.success for status in needs):
+                    statuses[job["name"]] = BuildStatus.running
+                    running[pool.submit(run_job, job)] = job["name"]
+
+            if not running:
+                return statuses
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    succeeded = future.result()
+                except Exception as e:
+                    print(f"ERROR in job {name}: {e}")
+                    succeeded = False
+                if cancelled is not None and cancelled.is_set():
+                    statuses[name] = BuildStatus.cancelled
+                else:
+                    statuses[name] = BuildStatus.success if succeeded else BuildStatus.failed
+
+def _topological_order(jobs):
+    by_name = {job["name"]: job for job in jobs}
+    ordered, visiting, visited = [], set(), set()
+
+    def visit(name):
+        if name in visited:
+            return
+        if name in visiting:
+            raise Exception(f"Configuration error: job '{name}' is part of a dependency cycle")
+        visiting.add(name)
+        for dependency in by_name[name]["needs"]:
+            visit(dependency)
+        visiting.discard(name)
+        visited.add(name)
+        ordered.append(by_name[name])
+
+    for job in jobs:
+        visit(job["name"])
+    return ordered
@@ -0,0 +1,59 @@
+import threading
+import time
+from swompi.functions import get_repo_ids_by_url, listen, REPOSITORIES_CHANNEL
+
+class RepositoryRegistry:
+    def __init__(self, db_session_factory, engine, config):
+        self.db_session_factory = db_session_factory
+        self.engine = engine
+        self.ttl = config.REPO_REGISTRY_TTL
+
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._repo_ids = {}
+        self._expires_at = 0.0
+        self._version = 0
+
+    def start(self):
+        if self.engine.dialect.name != "postgresql":
+            return
+        thread = threading.Thread(target=self._listen_loop, name="swompi-registry", daemon=True)
+        thread.start()
+
+    def lookup(self, url):
+        if time.monotonic() >= self._expires_at:
+            self._reload()
+        return self._repo_ids.get(url)
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._expires_at = 0.0
+
+    def _reload(self):
+        with self._reload_lock:
+            while True:
+                with self._lock:
+                    if time.monotonic() < self._expires_at:
+                        return
+                    version = self._version
+                with self.db_session_factory() as db_session:
+                    repo_ids = get_repo_ids_by_url(db_session)
+                with self._lock:
+                    self._repo_ids = repo_ids
+                    if version == self._version:
+                        self._expires_at = time.monotonic() + self.ttl
+                print(f"Repository registry loaded {len(repo_ids)} repositories")
+
+    def _listen_loop(self):
+        while True:
+            try:
+                listen(self.engine, REPOSITORIES_CHANNEL, self._on_change, self.ttl)
+            except Exception as e:
+                print(f"ERROR in repository change listener: {e}")
+            self.invalidate()
+            time.sleep(self.ttl)
+
+    def _on_change(self):
+        print("Tracked repositories changed, registry invalidated")
+        self.invalidate()
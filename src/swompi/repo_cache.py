@@ -0,0 +1,181 @@
+import os
+import time
+import fcntl
+import shutil
+import tempfile
+from contextlib import contextmanager
+from git import Repo, GitCommandError
+
+CLONE_MODES = ("full", "shallow", "partial")
+
+class RepositoryMirrorCache:
+    def __init__(self, config):
+        self.cache_dir = config.REPO_CACHE_DIR
+        self.max_size = config.REPO_CACHE_MAX_SIZE_MB * 1024 * 1024
+        self.default_depth = config.REPO_CACHE_SHALLOW_DEPTH
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def checkout(self, repository, commit_sha, workspace_path):
+        with self._locked(repository.id):
+            os.utime(self._lock_path(repository.id))
+            mirror = self._update_mirror(repository, commit_sha)
+            try:
+                if repository.clone_mode == "partial":
+                    self._fetch_missing_blobs(mirror, commit_sha)
+                print(f"Cloning mirror of {repository.url} into {workspace_path}")
+                repo = Repo.clone_from(mirror.git_dir, workspace_path, no_checkout=True)
+                if not self._has_commit(repo, commit_sha):
+                    repo.git.fetch("origin", "refs/swompi/pinned")
+                repo.remotes.origin.set_url(repository.url)
+                repo.git.checkout(commit_sha)
+            except GitCommandError as e:
+                raise RuntimeError(f"Failed to checkout commit {commit_sha}: {e}")
+
+        self._evict()
+
+    def blob_hash(self, repository, commit_sha, path):
+        with self._locked(repository.id):
+            os.utime(self._lock_path(repository.id))
+            mirror = self._update_mirror(repository, commit_sha)
+            try:
+                return mirror.git.rev_parse("--verify", f"{commit_sha}:{path}")
+            except GitCommandError:
+                return None
+
+    def read_blob(self, repository, blob_sha):
+        with self._locked(repository.id):
+            mirror = Repo(self._mirror_path(repository.id))
+            try:
+                return mirror.git.cat_file("blob", blob_sha, strip_newline_in_stdout=False)
+            except GitCommandError as e:
+                raise RuntimeError(f"Failed to read blob {blob_sha}: {e}")
+
+    def tree_hash(self, repository, commit_sha):
+        with self._locked(repository.id):
+            mirror = self._update_mirror(repository, commit_sha)
+            try:
+                return mirror.git.rev_parse(f"{commit_sha}^{{tree}}")
+            except GitCommandError as e:
+                raise RuntimeError(f"Failed to resolve the tree of commit {commit_sha}: {e}")
+
+    def changed_paths(self, repository, base_sha, commit_sha):
+        if not base_sha or not base_sha.strip("0"):
+            return None
+        with self._locked(repository.id):
+            mirror = Repo(self._mirror_path(repository.id))
+            if not self._has_commit(mirror, base_sha):
+                return None
+            try:
+                output = mirror.git.diff("--name-only", "--no-renames", base_sha, commit_sha)
+            except GitCommandError:
+                return None
+        return [path for path in output.splitlines() if path]
+
+    def _mirror_path(self, repository_id):
+        return os.path.join(self.cache_dir, f"{repository_id}.git")
+
+    def _lock_path(self, repository_id):
+        return os.path.join(self.cache_dir, f"{repository_id}.lock")
+
+    @contextmanager
+    def _locked(self, repository_id, blocking=True):
+        lock_path = self._lock_path(repository_id)
+        with open(lock_path, "a") as lock_file:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock_file, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _update_mirror(self, repository, commit_sha):
+        mirror_path = self._mirror_path(repository.id)
+        depth = repository.clone_depth or self.default_depth
+        depth_args = [f"--depth={depth}"] if repository.clone_mode == "shallow" else []
+
+        try:
+            if not os.path.isdir(mirror_path):
+                mirror = self._create_mirror(repository, mirror_path, depth)
+            else:
+                mirror = Repo(mirror_path)
+                mirror.remotes.origin.set_url(repository.url)
+                mirror.git.worktree("prune")
+                if self._has_commit(mirror, commit_sha):
+                    return mirror
+                print(f"Fetching {repository.url} into mirror {mirror_path}")
+                mirror.git.fetch("origin", "--prune", "--tags", *depth_args)
+
+            if not self._has_commit(mirror, commit_sha):
+                print(f"Commit {commit_sha} is not on any branch, fetching it directly")
+                mirror.git.fetch("origin", *depth_args, f"+{commit_sha}:refs/swompi/pinned")
+        except GitCommandError as e:
+            raise RuntimeError(f"Failed to update mirror of {repository.url}: {e}")
+
+        return mirror
+
+    def _create_mirror(self, repository, mirror_path, depth):
+        clone_kwargs = {"bare": True}
+        if repository.clone_mode == "shallow":
+            clone_kwargs["depth"] = depth
+            clone_kwargs["no_single_branch"] = True
+        elif repository.clone_mode == "partial":
+            clone_kwargs["filter"] = "blob:none"
+
+        print(f"Creating {repository.clone_mode} mirror of {repository.url} at {mirror_path}")
+        mirror = Repo.clone_from(repository.url, mirror_path, **clone_kwargs)
+        with mirror.config_writer() as writer:
+            writer.set_value('remote "origin"', "fetch", "+refs/heads/*:refs/heads/*")
+        return mirror
+
+    def _fetch_missing_blobs(self, mirror, commit_sha):
+        objects = mirror.git.rev_list("--objects", "--missing=print", commit_sha)
+        missing = [line[1:] for line in objects.splitlines() if line.startswith("?")]
+        if not missing:
+            return
+        print(f"Fetching {len(missing)} missing blob(s) of {commit_sha} into the mirror")
+        with tempfile.TemporaryFile("w+") as object_ids:
+            object_ids.write("\n".join(missing) + "\n")
+            object_ids.seek(0)
+            mirror.git.fetch("origin", "--no-tags", "--no-write-fetch-head", "--filter=blob:none", "--stdin", istream=object_ids)
+
+    def _has_commit(self, mirror, commit_sha):
+        try:
+            mirror.git.cat_file("-e", f"{commit_sha}^{{commit}}")
+            return True
+        except GitCommandError:
+            return False
+
+    def _evict(self):
+        mirrors = []
+        for entry in os.listdir(self.cache_dir):
+            if not entry.endswith(".git"):
+                continue
+            repository_id = entry[:-4]
+            lock_path = self._lock_path(repository_id)
+            last_used = os.path.getmtime(lock_path) if os.path.exists(lock_path) else 0
+            mirrors.append((last_used, repository_id, self._dir_size(os.path.join(self.cache_dir, entry))))
+
+        total = sum(size for _, _, size in mirrors)
+        for last_used, repository_id, size in sorted(mirrors):
+            if total <= self.max_size:
+                break
+            with self._locked(repository_id, blocking=False) as acquired:
+                if not acquired:
+                    continue
+                print(f"Evicting mirror {repository_id}, last used at {time.ctime(last_used)}")
+                shutil.rmtree(self._mirror_path(repository_id), ignore_errors=True)
+                total -= size
+
+    def _dir_size(self, path):
+        size = 0
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                try:
+                    size += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return size
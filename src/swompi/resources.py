@@ -0,0 +1,91 @@
+import os
+import re
+import threading
+from collections import deque
+from contextlib import contextmanager
+import docker
+
+MEMORY_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)\s*([kmg]?)b?$", re.IGNORECASE)
+MEMORY_UNITS_MB = {"k": 1 / 1024, "": 1, "m": 1, "g": 1024}
+
+def parse_memory_mb(value):
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = MEMORY_PATTERN.match(value.strip())
+    if not match:
+        raise ValueError(f"Invalid memory size '{value}'")
+    return int(float(match.group(1)) * MEMORY_UNITS_MB[match.group(2).lower()])
+
+class HostCapacity:
+    def __init__(self, config):
+        self.default_request = {
+            "cpus": float(config.DEFAULT_JOB_CPUS),
+            "memory_mb": config.DEFAULT_JOB_MEMORY_MB,
+            "pids": config.DEFAULT_JOB_PIDS
+        }
+        host_cpus = config.HOST_CPUS or os.cpu_count()
+        host_memory_mb = config.HOST_MEMORY_MB or _host_memory_mb()
+        self.cpus = max(host_cpus - config.HOST_RESERVED_CPUS, self.default_request["cpus"])
+        self.memory_mb = max(host_memory_mb - config.HOST_RESERVED_MEMORY_MB, self.default_request["memory_mb"])
+
+        self._cond = threading.Condition()
+        self._waiting = deque()
+        self._committed_cpus = 0.0
+        self._committed_memory_mb = 0
+        print(f"Build capacity: {self.cpus:g} CPU(s), {self.memory_mb} MB of memory")
+
+    def request_for(self, job):
+        resources = job.get("resources") or {}
+        request = {
+            "cpus": float(resources.get("cpus", self.default_request["cpus"])),
+            "memory_mb": parse_memory_mb(resources["memory"]) if "memory" in resources else self.default_request["memory_mb"],
+            "pids": resources.get("pids", self.default_request["pids"])
+        }
+        if request["cpus"] > self.cpus or request["memory_mb"] > self.memory_mb:
+            raise Exception(
+                f"Configuration error: job '{job['name']}' requests {request['cpus']:g} CPU(s) and {request['memory_mb']} MB, "
+                f"but builds may use at most {self.cpus:g} CPU(s) and {self.memory_mb} MB"
+            )
+        return request
+
+    def container_limits(self, request):
+        return {
+            "nano_cpus": int(request["cpus"] * 1e9),
+            "mem_limit": f"{request['memory_mb']}m",
+            "memswap_limit": f"{request['memory_mb']}m",
+            "pids_limit": request["pids"]
+        }
+
+    def wait_for_room(self, timeout):
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._waiting and self._fits(self.default_request), timeout)
+
+    @contextmanager
+    def reserve(self, request):
+        ticket = object()
+        with self._cond:
+            self._waiting.append(ticket)
+            self._cond.wait_for(lambda: self._waiting[0] is ticket and self._fits(request))
+            self._waiting.popleft()
+            self._committed_cpus += request["cpus"]
+            self._committed_memory_mb += request["memory_mb"]
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._committed_cpus -= request["cpus"]
+                self._committed_memory_mb -= request["memory_mb"]
+                self._cond.notify_all()
+
+    def _fits(self, request):
+        return (
+            self._committed_cpus + request["cpus"] <= self.cpus
+            and self._committed_memory_mb + request["memory_mb"] <= self.memory_mb
+        )
+
+def _host_memory_mb():
+    try:
+        return docker.from_env().info()["MemTotal"] // (1024 * 1024)
+    except Exception:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
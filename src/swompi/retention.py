@@ -0,0 +1,176 @@
+import os
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from botocore.exceptions import ClientError
+from swompi.functions import (
+    get_all_repos, get_expired_build_ids, get_build_object_keys, get_shared_object_keys,
+    get_stored_object_keys, delete_builds, count_builds_started_since, advisory_lock
+)
+from swompi.storage import DELETE_CHUNK_SIZE
+
+GC_LOCK_KEY = 0x5357474300000001
+CLOCK_SKEW = timedelta(minutes=1)
+
+class GarbageCollector:
+    def __init__(self, db_session_factory, engine, file_storage, config):
+        self.db_session_factory = db_session_factory
+        self.engine = engine
+        self.file_storage = file_storage
+        self.keep_builds = config.RETENTION_KEEP_BUILDS
+        self.keep_days = config.RETENTION_KEEP_DAYS
+        self.keep_latest_success = config.RETENTION_KEEP_LATEST_SUCCESS
+        self.interval = config.GC_INTERVAL
+        self.batch_size = config.GC_BATCH_SIZE
+        self.blob_grace = timedelta(hours=config.GC_BLOB_GRACE_HOURS)
+        self._sweep_pending = False
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        thread = threading.Thread(target=self._run_loop, name="swompi-gc", daemon=True)
+        thread.start()
+        print(f"Garbage collection scheduled every {self.interval}s")
+
+    def policy_for(self, repository):
+        return (
+            repository.keep_builds if repository.keep_builds is not None else self.keep_builds,
+            repository.keep_days if repository.keep_days is not None else self.keep_days,
+            repository.keep_latest_success if repository.keep_latest_success is not None else self.keep_latest_success
+        )
+
+    def run(self, dry_run=False):
+        with advisory_lock(self.engine, GC_LOCK_KEY) as acquired:
+            if not acquired:
+                print("Garbage collection is already running elsewhere, skipped")
+                return None
+            return self._collect(dry_run)
+
+    def _run_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run()
+            except Exception as e:
+                print(f"ERROR during garbage collection: {e}")
+
+    def _collect(self, dry_run):
+        stats = {"builds": 0, "objects": 0, "blobs": 0}
+        with self.db_session_factory() as db_session:
+            repositories = get_all_repos(db_session)
+
+        for repository in repositories:
+            keep_builds, keep_days, keep_latest_success = self.policy_for(repository)
+            after_id = 0
+            while True:
+                with self.db_session_factory() as db_session:
+                    build_ids = get_expired_build_ids(
+                        db_session, repository.id, keep_builds, keep_days, keep_latest_success, self.batch_size, after_id
+                    )
+                if not build_ids:
+                    break
+                after_id = build_ids[-1]
+                if dry_run:
+                    stats["builds"] += len(build_ids)
+                    continue
+
+                removed, objects, manifests = self._prune_batch(build_ids)
+                stats["builds"] += removed
+                stats["objects"] += objects
+                self._sweep_pending = self._sweep_pending or manifests
+                print(f"GC: removed {removed} build(s) and {objects} object(s) of {repository.name}")
+
+        if self._sweep_pending and self.file_storage.artifact_store and not dry_run:
+            stats["blobs"] = self._sweep_blobs()
+        return stats
+
+    def _prune_batch(self, build_ids):
+        with self.db_session_factory() as db_session:
+            rows = get_build_object_keys(db_session, build_ids)
+            keys = [key for _, log_key, artifacts_key in rows for key in (log_key, artifacts_key) if key and key != "None"]
+            shared = get_shared_object_keys(db_session, keys, build_ids) if keys else set()
+
+        build_keys = {}
+        for build_id, log_key, artifacts_key in rows:
+            own_keys = [
+                key for key in (log_key, artifacts_key)
+                if key and key != "None" and key not in shared and not key.startswith("blobs/")
+            ]
+            build_keys[build_id] = own_keys + self.file_storage.build_object_keys(build_id)
+        object_keys = list(dict.fromkeys(key for keys in build_keys.values() for key in keys))
+        manifests = any(key.startswith("manifests/") for key in object_keys)
+        failed = set(self.file_storage.delete_objects(object_keys))
+
+        removable = [build_id for build_id in build_ids if failed.isdisjoint(build_keys.get(build_id, ()))]
+        if len(removable) < len(build_ids):
+            print(f"GC: kept {len(build_ids) - len(removable)} build(s) whose objects could not be deleted")
+        removed = 0
+        if removable:
+            with self.db_session_factory() as db_session:
+                removed = delete_builds(db_session, removable)
+        return removed, len(object_keys) - len(failed), manifests
+
+    def _sweep_blobs(self):
+        store = self.file_storage.artifact_store
+        started = datetime.now().replace(microsecond=0) - CLOCK_SKEW
+        if self._builds_active(started):
+            print("GC: builds are running, blob sweep postponed")
+            return 0
+        with self.db_session_factory() as db_session:
+            stored_keys = get_stored_object_keys(db_session)
+
+        referenced = {key for key in stored_keys if key.startswith("blobs/")}
+        for blob_keys in self._manifest_blobs(stored_keys).values():
+            referenced.update(blob_keys)
+
+        cutoff = datetime.now(timezone.utc) - self.blob_grace
+        unreferenced = [
+            key for key, last_modified in self.file_storage.list_objects("blobs/")
+            if key not in referenced and last_modified < cutoff
+        ]
+        if unreferenced:
+            store.bump_generation()
+
+        deleted = 0
+        for start in range(0, len(unreferenced), DELETE_CHUNK_SIZE):
+            if self._builds_active(started):
+                print(f"GC: a build started during the blob sweep, postponed after {deleted} blob(s)")
+                return deleted
+            chunk = unreferenced[start:start + DELETE_CHUNK_SIZE]
+            deleted += len(chunk) - len(self.file_storage.delete_objects(chunk))
+        self._sweep_pending = deleted < len(unreferenced)
+        print(f"GC: removed {deleted} unreferenced blob(s)")
+        return deleted
+
+    def _manifest_blobs(self, stored_keys):
+        store = self.file_storage.artifact_store
+        cache_path = f"{store.index_path}.manifests"
+        cached = {}
+        if os.path.exists(cache_path):
+            with open(cache_path) as cache_file:
+                cached = json.load(cache_file)
+
+        manifest_blobs = {}
+        for key in stored_keys:
+            if not key.startswith("manifests/"):
+                continue
+            if key in cached:
+                manifest_blobs[key] = cached[key]
+                continue
+            try:
+                manifest = store.load_manifest(key)
+            except ClientError as e:
+                if e.response['Error']['Code'] in ['404', 'NoSuchKey', 'NotFound']:
+                    continue
+                raise
+            manifest_blobs[key] = [store.blob_key(entry["sha256"]) for entry in manifest["files"]]
+
+        with open(cache_path + ".tmp", "w") as cache_file:
+            json.dump(manifest_blobs, cache_file)
+        os.replace(cache_path + ".tmp", cache_path)
+        return manifest_blobs
+
+    def _builds_active(self, since):
+        with self.db_session_factory() as db_session:
+            return count_builds_started_since(db_session, since) > 0
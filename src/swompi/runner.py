@@ -0,0 +1,50 @@
+import click
+import threading
+from prometheus_client import start_http_server
+from swompi.config import AppConfig
+from swompi.session import engine, SessionLocal as db_session_factory
+from swompi.storage import FileStorageRepository
+from swompi.executor import Executor
+from swompi.dispatcher import BuildDispatcher
+from swompi.metrics import instrument_engine, instrument_s3
+
+@click.command()
+@click.option("--name", default=None, help="Unique runner name, <hostname>-<pid> by default")
+@click.option("--label", "labels", multiple=True, help="Label advertised to jobs (repeatable), e.g. large-memory")
+@click.option("--concurrency", type=int, default=None, help="Number of builds executed in parallel")
+@click.option("--metrics-port", type=int, default=None, help="Serve Prometheus metrics of this runner on the given port")
+def runner(name, labels, concurrency, metrics_port):
+    config = AppConfig()
+    if name:
+        config.RUNNER_NAME = name
+    if labels:
+        config.RUNNER_LABELS = list(labels)
+    if concurrency:
+        config.MAX_CONCURRENT_BUILDS = concurrency
+    if metrics_port:
+        config.RUNNER_METRICS_PORT = metrics_port
+
+    file_storage = FileStorageRepository(config)
+    executor = Executor(db_session_factory, file_storage, config)
+    dispatcher = BuildDispatcher(db_session_factory, executor, config, engine)
+
+    instrument_engine(engine)
+    instrument_s3(file_storage.s3_client)
+    if config.RUNNER_METRICS_PORT:
+        start_http_server(config.RUNNER_METRICS_PORT)
+        click.echo(f"Serving runner metrics on port {config.RUNNER_METRICS_PORT}")
+
+    executor.image_resolver.start_prewarm()
+    executor.workspaces.start()
+    executor.container_pool.start()
+    executor.notifications.start()
+    dispatcher.start()
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        click.echo("Stopping runner, waiting for running builds to finish...")
+        dispatcher.stop()
+
+if __name__ == '__main__':
+    runner()
@@ -1,22 +1,36 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
 from botocore.exceptions import ClientError
 import os
-import shutil
-import py7zr
+from swompi.archive import ARCHIVE_FORMATS, S3MultipartWriter, write_tar_archive, write_7z_archive
+from swompi.artifacts import ContentAddressedStore
+from swompi.metrics import PhaseTimer, phase
+
+DELETE_CHUNK_SIZE = 1000
 
 class FileStorageRepository:
     def __init__(self, config):
-        self.s3_client = self._create_s3_client(config)
+        self.s3_client = self._create_s3_client(config, config.S3_ENDPOINT_URL)
+        self.presign_client = self._create_s3_client(config, config.S3_PUBLIC_URL) if config.S3_PUBLIC_URL else self.s3_client
+        self.presigned_url_ttl = config.PRESIGNED_URL_TTL
         self.BUCKET = "swompi-runner"
+        self.archive_format = config.ARCHIVE_FORMAT
+        self.archive_level = config.ARCHIVE_LEVEL
+        self.part_size = config.UPLOAD_PART_SIZE_MB * 1024 * 1024
+        self.upload_concurrency = config.UPLOAD_CONCURRENCY
+        if self.archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"ARCHIVE_FORMAT must be one of {', '.join(ARCHIVE_FORMATS)}")
+        self.download_format = "tar.zst" if self.archive_format == "7z" else self.archive_format
         self._ensure_buckets_exist()
+        self.artifact_store = ContentAddressedStore(self.s3_client, self.BUCKET, config) if config.ARTIFACT_DEDUP else None
 
-    def _create_s3_client(self, config):
+    def _create_s3_client(self, config, endpoint_url):
         s3 = boto3.resource('s3')
 
         s3_client = boto3.client(
             's3',
-            endpoint_url=config.S3_ENDPOINT_URL,
+            endpoint_url=endpoint_url,
             aws_access_key_id=config.S3_ACCESS_KEY,
             aws_secret_access_key=config.S3_SECRET_KEY,
             region_name=config.S3_DEFAULT_REGION,
@@ -37,35 +51,235 @@ class FileStorageRepository:
             else:
                 raise
 
-    def upload_logs_and_artifacts(self, build_id: int, workspace_path: str, artifacts: None | list[str]) -> str:
-        object_key = f"{build_id}.7z"
-        archive_filename = f"build_{build_id}_archive.7z"
-        archive_dir = os.path.join(workspace_path, archive_filename)
-        staging_dir = os.path.join(workspace_path, "archive")
-        os.makedirs(staging_dir)
-        
-        shutil.move(os.path.join(workspace_path, "build.log"), staging_dir)
-        
-        if artifacts:
-            for artifact in artifacts:
-                artifact_path = os.path.join(workspace_path, artifact)
-                if os.path.exists(artifact_path):
-                    shutil.move(artifact_path, staging_dir)
-        
-        print(f"Creating archive at: {archive_dir}")
-        with py7zr.SevenZipFile(archive_dir, 'w') as archive:
-            archive.writeall(staging_dir, 'build_files')
-
-        print(f"Uploading {archive_dir} to S3 as {object_key}...")
-
-        self.s3_client.upload_file(
-            archive_dir,
-            self.BUCKET,
-            object_key
-        )
+    def upload_logs_and_artifacts(self, build_id: int, outputs: list[tuple[str, str, None | list[str]]], timer: PhaseTimer | None = None) -> tuple[str, str | None]:
+        object_key = f"{build_id}.{self.archive_format}"
+        members = []
+        for prefix, workspace_path, artifacts in outputs:
+            members += self._collect_archive_members(prefix, workspace_path, artifacts)
+
+        if self.artifact_store:
+            with phase(timer, "upload"):
+                manifest_key, manifest = self.artifact_store.upload_tree(build_id, members)
+            log_digest = next((entry["sha256"] for entry in manifest["files"] if entry["path"] == "build_files/build.log"), None)
+            print(f"Logs and artifacts for build {build_id} stored under manifest {self.BUCKET}/{manifest_key}")
+            return self.artifact_store.blob_key(log_digest) if log_digest else None, manifest_key
+
+        if self.archive_format == "7z":
+            archive_path = os.path.join(outputs[0][1], f"build_{build_id}_archive.7z")
+            print(f"Creating archive at: {archive_path}")
+            with phase(timer, "archive"):
+                write_7z_archive(archive_path, members)
+
+            print(f"Uploading {archive_path} to S3 as {object_key}...")
+            with phase(timer, "upload"):
+                self.s3_client.upload_file(
+                    archive_path,
+                    self.BUCKET,
+                    object_key,
+                    Config=TransferConfig(multipart_chunksize=self.part_size, max_concurrency=self.upload_concurrency)
+                )
+        else:
+            print(f"Streaming {self.archive_format} archive to S3 as {object_key}...")
+            with phase(timer, "upload"), S3MultipartWriter(self.s3_client, self.BUCKET, object_key, self.part_size, self.upload_concurrency) as writer:
+                write_tar_archive(writer, members, self.archive_format, self.archive_level)
 
         print(f"Logs and artifacts for build {build_id} uploaded to {self.BUCKET}/{object_key}")
-        return object_key
+        return object_key, None
+
+    def _collect_archive_members(self, prefix: str, workspace_path: str, artifacts: None | list[str]) -> list[tuple[str, str]]:
+        members = []
+        log_path = os.path.join(workspace_path, "build.log")
+        if os.path.exists(log_path):
+            members.append((log_path, f"build_files/{prefix}build.log"))
+        workspace_root = os.path.realpath(workspace_path)
+
+        for artifact in artifacts or []:
+            artifact_path = os.path.realpath(os.path.join(workspace_path, artifact))
+            if not artifact_path.startswith(workspace_root + os.sep):
+                print(f"Skipping artifact {artifact}: path is outside of the workspace")
+                continue
+            if os.path.exists(artifact_path):
+                members.append((artifact_path, f"build_files/{prefix}{os.path.basename(artifact_path)}"))
+        return members
+
+    def upload_log_segment(self, build_id: int, job_name: str, sequence: int, data: bytes) -> None:
+        self.s3_client.put_object(
+            Bucket=self.BUCKET,
+            Key=f"{self._log_prefix(build_id)}{job_name}/{sequence:08d}",
+            Body=data
+        )
+
+    def list_log_jobs(self, build_id: int) -> list[str]:
+        prefix = self._log_prefix(build_id)
+        jobs = []
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.BUCKET, Prefix=prefix, Delimiter="/"):
+            for common_prefix in page.get("CommonPrefixes", []):
+                jobs.append(common_prefix["Prefix"][len(prefix):].rstrip("/"))
+        return jobs
+
+    def read_log(self, build_id: int, job_name: str, offset: int = 0, limit: int = 65536) -> tuple[bytes, int]:
+        segments = self._list_log_segments(build_id, job_name)
+        if offset < 0:
+            offset = max(sum(size for _, size in segments) + offset, 0)
+        end = offset + limit
+
+        chunks = []
+        position = 0
+        for key, size in segments:
+            segment_start, segment_end = position, position + size
+            position = segment_end
+            if segment_end <= offset or segment_start >= end:
+                continue
+
+            range_start = max(offset, segment_start) - segment_start
+            range_end = min(end, segment_end) - segment_start - 1
+            response = self.s3_client.get_object(Bucket=self.BUCKET, Key=key, Range=f"bytes={range_start}-{range_end}")
+            chunks.append(response["Body"].read())
+
+        data = b"".join(chunks)
+        return data, offset + len(data)
+
+    def _log_prefix(self, build_id: int) -> str:
+        return f"logs/{build_id}/"
+
+    def _list_log_segments(self, build_id: int, job_name: str) -> list[tuple[str, int]]:
+        segments = []
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.BUCKET, Prefix=f"{self._log_prefix(build_id)}{job_name}/"):
+            for item in page.get("Contents", []):
+                segments.append((item["Key"], item["Size"]))
+        return segments
+
+    def build_archive_extension(self, log_key: str, artifacts_key: str | None) -> str:
+        if artifacts_key:
+            return self.download_format
+        return log_key.split(".", 1)[1]
+
+    def download_build_archive(self, log_key: str, artifacts_key: str | None, download_path: str) -> bool:
+        if not artifacts_key:
+            return self.download_file_to_path(log_key, download_path)
+
+        try:
+            manifest = self.artifact_store.load_manifest(artifacts_key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ['404', 'NoSuchKey']:
+                print(f"Manifest not found: {self.BUCKET}/{artifacts_key}")
+                return False
+            raise
+
+        with open(download_path, "wb") as f:
+            self.artifact_store.write_archive(manifest, f, self.download_format)
+        print(f"Archive for manifest {self.BUCKET}/{artifacts_key} assembled at {download_path}")
+        return True
+
+    def build_archive_size(self, log_key: str, artifacts_key: str | None) -> int | None:
+        if artifacts_key:
+            files = self.list_build_files(artifacts_key)
+            return sum(entry["size"] for entry in files) if files is not None else None
+        try:
+            return self.s3_client.head_object(Bucket=self.BUCKET, Key=log_key)["ContentLength"]
+        except ClientError as e:
+            if e.response['Error']['Code'] in ['404', 'NoSuchKey', 'NotFound']:
+                return None
+            raise
+
+    def build_archive_url(self, build_id: int, log_key: str, artifacts_key: str | None) -> str:
+        filename = f"build_{build_id}.{self.build_archive_extension(log_key, artifacts_key)}"
+        if not artifacts_key:
+            return self.presigned_url(log_key, filename)
+
+        object_key = f"downloads/{build_id}.{self.download_format}"
+        if not self._object_exists(object_key):
+            manifest = self.artifact_store.load_manifest(artifacts_key)
+            with S3MultipartWriter(self.s3_client, self.BUCKET, object_key, self.part_size, self.upload_concurrency) as writer:
+                self.artifact_store.write_archive(manifest, writer, self.download_format)
+            print(f"Archive for manifest {self.BUCKET}/{artifacts_key} assembled at {self.BUCKET}/{object_key}")
+        return self.presigned_url(object_key, filename)
+
+    def list_build_files(self, artifacts_key: str | None) -> list[dict] | None:
+        if not artifacts_key or not self.artifact_store:
+            return None
+        try:
+            manifest = self.artifact_store.load_manifest(artifacts_key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ['404', 'NoSuchKey']:
+                print(f"Manifest not found: {self.BUCKET}/{artifacts_key}")
+                return None
+            raise
+        return [entry | {"name": entry["path"].removeprefix("build_files/")} for entry in manifest["files"]]
+
+    def find_build_file(self, artifacts_key: str | None, name: str) -> dict | None:
+        files = self.list_build_files(artifacts_key) or []
+        name = name.strip("/")
+        exact = [entry for entry in files if entry["name"] == name]
+        if exact:
+            return exact[0]
+        by_basename = [entry for entry in files if os.path.basename(entry["name"]) == name]
+        return by_basename[0] if len(by_basename) == 1 else None
+
+    def read_build_file(self, entry: dict, offset: int = 0, limit: int | None = None) -> tuple[bytes, int]:
+        size = entry["size"]
+        if offset < 0:
+            offset = max(size + offset, 0)
+        end = size if limit is None else min(offset + limit, size)
+        if offset >= end:
+            return b"", offset
+
+        response = self.s3_client.get_object(
+            Bucket=self.BUCKET,
+            Key=self.artifact_store.blob_key(entry["sha256"]),
+            Range=f"bytes={offset}-{end - 1}"
+        )
+        return response["Body"].read(), end
+
+    def build_file_url(self, entry: dict) -> str:
+        return self.presigned_url(self.artifact_store.blob_key(entry["sha256"]), os.path.basename(entry["name"]))
+
+    def presigned_url(self, object_key: str, filename: str) -> str:
+        return self.presign_client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.BUCKET,
+                "Key": object_key,
+                "ResponseContentDisposition": f'attachment; filename="{filename}"'
+            },
+            ExpiresIn=self.presigned_url_ttl
+        )
+
+    def build_object_keys(self, build_id: int) -> list[str]:
+        keys = []
+        for prefix in (self._log_prefix(build_id), f"downloads/{build_id}."):
+            keys += [key for key, _ in self.list_objects(prefix)]
+        return keys
+
+    def list_objects(self, prefix: str):
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.BUCKET, Prefix=prefix):
+            for item in page.get("Contents", []):
+                yield item["Key"], item["LastModified"]
+
+    def delete_objects(self, object_keys: list[str]) -> list[str]:
+        failed = []
+        for start in range(0, len(object_keys), DELETE_CHUNK_SIZE):
+            chunk = object_keys[start:start + DELETE_CHUNK_SIZE]
+            response = self.s3_client.delete_objects(
+                Bucket=self.BUCKET,
+                Delete={"Objects": [{"Key": key} for key in chunk], "Quiet": True}
+            )
+            for error in response.get("Errors", []):
+                print(f"ERROR while deleting {self.BUCKET}/{error['Key']}: {error.get('Message')}")
+                failed.append(error["Key"])
+        return failed
+
+    def _object_exists(self, object_key: str) -> bool:
+        try:
+            self.s3_client.head_object(Bucket=self.BUCKET, Key=object_key)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ['404', 'NoSuchKey', 'NotFound']:
+                return False
+            raise
 
     def download_file_to_path(self, object_key: str, download_path: str):
         try:
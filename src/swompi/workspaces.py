@@ -0,0 +1,173 @@
+import os
+import time
+import fcntl
+import queue
+import shutil
+import tempfile
+import threading
+import subprocess
+
+WORKSPACE_BACKENDS = ("disk", "tmpfs", "overlay")
+
+class Workspace:
+    def __init__(self, backend, root, path, mount_point=None, base_lock=None):
+        self.backend = backend
+        self.root = root
+        self.path = path
+        self.mount_point = mount_point
+        self.base_lock = base_lock
+
+class WorkspaceManager:
+    def __init__(self, config, repo_cache):
+        self.repo_cache = repo_cache
+        self.default_backend = config.WORKSPACE_BACKEND
+        self.root = config.WORKSPACE_DIR
+        self.tmpfs_size = config.WORKSPACE_TMPFS_SIZE_MB
+        self.base_dir = config.WORKSPACE_BASE_DIR
+        self.max_bases = config.WORKSPACE_BASE_KEEP
+        os.makedirs(self.root, exist_ok=True)
+
+        self._cleanup_queue = queue.Queue()
+        self._cleanup_thread = None
+
+    def start(self):
+        self._cleanup_thread = threading.Thread(target=self._cleanup_loop, name="swompi-workspace-cleanup", daemon=True)
+        self._cleanup_thread.start()
+        print(f"Workspace cleanup started, default backend: {self.default_backend}")
+
+    def create(self, build_id):
+        root = tempfile.mkdtemp(prefix=f"swompi_build_{build_id}_", dir=self.root)
+        return Workspace("disk", root, root)
+
+    def checkout(self, build_id, repository, commit_sha):
+        backend = repository.workspace_backend or self.default_backend
+        workspace = None
+        if backend == "tmpfs":
+            workspace = self._create_tmpfs(build_id)
+        elif backend == "overlay":
+            workspace = self._create_overlay(build_id, repository, commit_sha)
+            if workspace:
+                print(f"Workspace {workspace.path} is an overlay of {commit_sha}")
+                return workspace
+        workspace = workspace or self.create(build_id)
+
+        print(f"Preparing {repository.url} at commit {commit_sha} in {workspace.path} ({workspace.backend})")
+        try:
+            self.repo_cache.checkout(repository, commit_sha, workspace.path)
+        except Exception:
+            self.release(workspace)
+            raise
+        return workspace
+
+    def release(self, workspace):
+        if self._cleanup_thread is None:
+            self._cleanup(workspace)
+        else:
+            self._cleanup_queue.put(workspace)
+
+    def _create_tmpfs(self, build_id):
+        workspace = self.create(build_id)
+        try:
+            _mount("tmpfs", workspace.root, f"size={self.tmpfs_size}m,mode=0755")
+        except RuntimeError as e:
+            print(f"ERROR while mounting a tmpfs workspace, using disk instead: {e}")
+            return workspace
+        return Workspace("tmpfs", workspace.root, workspace.root, mount_point=workspace.root)
+
+    def _create_overlay(self, build_id, repository, commit_sha):
+        base_path, base_lock = self._acquire_base(repository, commit_sha)
+        root = tempfile.mkdtemp(prefix=f"swompi_build_{build_id}_", dir=self.root)
+        upper, work, merged = (os.path.join(root, name) for name in ("upper", "work", "merged"))
+        for path in (upper, work, merged):
+            os.mkdir(path)
+
+        try:
+            _mount("overlay", merged, f"lowerdir={base_path},upperdir={upper},workdir={work}")
+        except RuntimeError as e:
+            print(f"ERROR while mounting an overlay workspace, using disk instead: {e}")
+            base_lock.close()
+            shutil.rmtree(root, ignore_errors=True)
+            return None
+        return Workspace("overlay", root, merged, mount_point=merged, base_lock=base_lock)
+
+    def _acquire_base(self, repository, commit_sha):
+        base_path = os.path.join(self.base_dir, f"{repository.id}-{commit_sha}")
+        ready_path = base_path + ".ready"
+        os.makedirs(self.base_dir, exist_ok=True)
+        while True:
+            lock_file = open(base_path + ".lock", "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_SH)
+                if not os.path.exists(ready_path):
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    if not os.path.exists(ready_path):
+                        shutil.rmtree(base_path, ignore_errors=True)
+                        print(f"Creating overlay base of {repository.url} at {commit_sha}")
+                        self.repo_cache.checkout(repository, commit_sha, base_path)
+                        open(ready_path, "a").close()
+                    fcntl.flock(lock_file, fcntl.LOCK_SH)
+            except Exception:
+                lock_file.close()
+                raise
+
+            if os.path.exists(ready_path):
+                os.utime(lock_file.name)
+                return base_path, lock_file
+            lock_file.close()
+
+    def _evict_bases(self):
+        bases = []
+        if not os.path.isdir(self.base_dir):
+            return
+        for entry in os.listdir(self.base_dir):
+            if entry.endswith(".ready"):
+                lock_path = os.path.join(self.base_dir, entry[:-6] + ".lock")
+                last_used = os.path.getmtime(lock_path) if os.path.exists(lock_path) else 0
+                bases.append((last_used, entry[:-6]))
+
+        for last_used, name in sorted(bases, reverse=True)[self.max_bases:]:
+            base_path = os.path.join(self.base_dir, name)
+            with open(base_path + ".lock", "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                print(f"Evicting overlay base {name}, last used at {time.ctime(last_used)}")
+                os.unlink(base_path + ".ready")
+                shutil.rmtree(base_path, ignore_errors=True)
+
+    def _cleanup_loop(self):
+        while True:
+            workspace = self._cleanup_queue.get()
+            try:
+                self._cleanup(workspace)
+            except Exception as e:
+                print(f"ERROR while cleaning up workspace {workspace.path}: {e}")
+
+    def _cleanup(self, workspace):
+        print(f"Cleaning up workspace: {workspace.path}")
+        if workspace.mount_point:
+            try:
+                _umount(workspace.mount_point)
+            except RuntimeError as e:
+                print(f"ERROR while unmounting {workspace.mount_point}, detaching it lazily: {e}")
+                _umount(workspace.mount_point, lazy=True)
+        shutil.rmtree(workspace.root, ignore_errors=True)
+        if workspace.base_lock:
+            workspace.base_lock.close()
+            self._evict_bases()
+
+def _mount(fstype, target, options):
+    _run(["mount", "-t", fstype, "-o", options, fstype, target])
+
+def _umount(target, lazy=False):
+    _run(["umount", "-l", target] if lazy else ["umount", target])
+
+def _run(command):
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+    except OSError as e:
+        raise RuntimeError(str(e))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"{command[0]} exited with code {result.returncode}")